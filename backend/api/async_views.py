@@ -0,0 +1,158 @@
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.urls import path
+from rest_framework.response import Response
+
+from .public_cache import cached_public_response, remember_public_response
+from .relations import get_user_relations
+from .views import IngredientsViewSet, RecipeViewSet, TagViewSet, UserViewSet
+
+# Связи пользователя, которые нужны полям рецепта.
+FIELD_RELATIONS = (
+    ('is_favorited', 'favorites'),
+    ('is_in_shopping_cart', 'cart'),
+    ('author', 'following'),
+)
+
+
+def in_thread(func):
+    """Синхронная функция в отдельном потоке со своим соединением с БД.
+
+    Так независимые запросы одного ответа идут к базе параллельно.
+    Потоки переиспользуются, поэтому соединения держатся DB_CONN_MAX_AGE
+    секунд; перед вызовом закрываются только устаревшие и сломанные.
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        return func(*args, **kwargs)
+
+    return sync_to_async(functools.wraps(func)(run), thread_sensitive=False)
+
+
+def render(response):
+    """Рендерит ответ DRF в рабочем потоке.
+
+    Django отрендерил бы его в общем потоке синхронного кода, поэтому
+    наружу уходит обычный HttpResponse с тем же содержимым.
+    """
+    if not hasattr(response, 'render'):
+        return response
+    response.render()
+    plain = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    return plain
+
+
+def async_view(viewset, actions, handler=None, **initkwargs):
+    """Асинхронное представление поверх ViewSet DRF.
+
+    GET проходит через тот же ViewSet, что и синхронный режим:
+    аутентификацию, права, фильтры, пагинацию, сериализаторы и обработку
+    ошибок. handler выполняет действие, распараллеливая независимые
+    запросы к базе; без него действие целиком выполняется в рабочем
+    потоке. Остальные методы уходят в обычное представление DRF.
+    """
+    fallback = viewset.as_view(actions, **initkwargs)
+    actions = {'head': actions['get'], **actions}
+
+    async def view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(fallback)(request, *args, **kwargs)
+        # То же, что делают ViewSetMixin.as_view и APIView.dispatch.
+        self = viewset(**initkwargs)
+        self.action_map = actions
+        for method, action in actions.items():
+            setattr(self, method, getattr(self, action))
+        self.args, self.kwargs = args, kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await in_thread(self.initial)(request, *args, **kwargs)
+            if handler is None:
+                response = await in_thread(self.get)(
+                    request, *args, **kwargs
+                )
+            else:
+                response = await handler(self, request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        response = self.finalize_response(request, response, *args, **kwargs)
+        return await in_thread(render)(response)
+
+    view.csrf_exempt = True
+    return view
+
+
+async def load_relations(view):
+    """Связи пользователя, нужные полям рецепта, параллельно друг другу."""
+    if view.request.user.is_anonymous:
+        return
+    fields = view.get_recipe_fields()
+    relations = get_user_relations(view.request)
+    await asyncio.gather(*(
+        in_thread(relations.load)(kind)
+        for field, kind in FIELD_RELATIONS if field in fields
+    ))
+
+
+async def list_recipes(view, request):
+    """RecipeViewSet.list: страница и связи пользователя одновременно."""
+    key, cached = await in_thread(cached_public_response)(request)
+    if cached is not None:
+        return cached
+    queryset = await in_thread(
+        lambda: view.filter_queryset(view.get_queryset())
+    )()
+    page, _ = await asyncio.gather(
+        in_thread(view.paginate_queryset)(queryset), load_relations(view)
+    )
+    items = queryset if page is None else page
+    data = await in_thread(
+        lambda: view.get_serializer(items, many=True).data
+    )()
+    if page is None:
+        return remember_public_response(key, Response(data))
+    return remember_public_response(key, view.get_paginated_response(data))
+
+
+async def retrieve_recipe(view, request, pk):
+    """RecipeViewSet.retrieve: рецепт и связи пользователя одновременно."""
+    key, cached = await in_thread(cached_public_response)(request)
+    if cached is not None:
+        return cached
+    instance, _ = await asyncio.gather(
+        in_thread(view.get_object)(), load_relations(view)
+    )
+    data = await in_thread(lambda: view.get_serializer(instance).data)()
+    return remember_public_response(key, Response(data))
+
+
+urlpatterns = [
+    path('recipes/', async_view(
+        RecipeViewSet, {'get': 'list', 'post': 'create'}, list_recipes,
+        basename='recipes', detail=False,
+    ), name='recipes-list'),
+    path('recipes/<int:pk>/', async_view(
+        RecipeViewSet, {
+            'get': 'retrieve', 'put': 'update',
+            'patch': 'partial_update', 'delete': 'destroy',
+        }, retrieve_recipe, basename='recipes', detail=True,
+    ), name='recipes-detail'),
+    path('tags/', async_view(
+        TagViewSet, {'get': 'list'}, basename='tags', detail=False,
+    ), name='tags-list'),
+    path('ingredients/', async_view(
+        IngredientsViewSet, {'get': 'list', 'post': 'create'},
+        basename='ingredients', detail=False,
+    ), name='ingredients-list'),
+    path('users/subscriptions/', async_view(
+        UserViewSet, {'get': 'subscriptions'},
+        basename='users', detail=False, **UserViewSet.subscriptions.kwargs,
+    ), name='users-subscriptions'),
+]
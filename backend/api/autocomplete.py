@@ -0,0 +1,77 @@
+import threading
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Ingredient
+from .serializers import IngredientSerializer
+
+VERSION_KEY = 'ingredients:index:version'
+
+
+def normalize(value):
+    """Приводит название к виду для поиска: регистр, ё, пробелы."""
+    return ' '.join(value.lower().replace('ё', 'е').split())
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Загружается при первом обращении и перестраивается, когда меняется
+    версия каталога в общем кэше.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        self._snapshot = None
+
+    def search(self, query, limit=None):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        query = normalize(query)
+        names, items = self._get_snapshot()
+        result = []
+        start = bisect_left(names, query)
+        for position in range(start, len(names)):
+            if not names[position].startswith(query):
+                break
+            result.append(items[position])
+            if len(result) == limit:
+                return result
+        for name, item in zip(names, items):
+            if query in name and not name.startswith(query):
+                result.append(item)
+                if len(result) == limit:
+                    break
+        return result
+
+    def _get_snapshot(self):
+        version = cache.get(VERSION_KEY)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[0] == version:
+            return snapshot[1:]
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot[0] != version:
+                snapshot = (version, *self._build())
+                self._snapshot = snapshot
+        return snapshot[1:]
+
+    def _build(self):
+        data = IngredientSerializer(Ingredient.objects.all(), many=True).data
+        entries = sorted(
+            (normalize(item['name']), item['id'], dict(item)) for item in data
+        )
+        return (
+            [name for name, _, _ in entries],
+            [item for _, _, item in entries],
+        )
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,68 @@
+from django.db import transaction
+
+from .links import TARGETS, changed, write_links
+from .models import Follow
+
+MAX_IDS = 100
+
+ADDED = 'added'
+REMOVED = 'removed'
+EXISTS = 'exists'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+FORBIDDEN = 'forbidden'
+
+
+@transaction.atomic
+def bulk_add(model, user, ids):
+    """Добавляет связи одним INSERT и возвращает статус каждого id."""
+    field, target = TARGETS[model]
+    found = set(target.objects.filter(
+        pk__in=ids
+    ).order_by().values_list('pk', flat=True))
+    present = set(model.objects.filter(
+        user=user, **{f'{field}__in': found}
+    ).values_list(field, flat=True))
+    result = {}
+    new = []
+    for pk in ids:
+        if pk not in found:
+            result[pk] = NOT_FOUND
+        elif model is Follow and pk == user.pk:
+            result[pk] = FORBIDDEN
+        elif pk in present:
+            result[pk] = EXISTS
+        else:
+            result[pk] = ADDED
+            new.append(pk)
+    if new:
+        # Конкурентная вставка той же пары не падает на уникальности.
+        model.objects.bulk_create(
+            (model(user=user, **{field: pk}) for pk in new),
+            ignore_conflicts=True,
+        )
+        changed(model, user.pk, new, added=True)
+    return result
+
+
+@transaction.atomic
+def bulk_remove(model, user, ids):
+    """Удаляет связи одним DELETE и возвращает статус каждого id."""
+    field, target = TARGETS[model]
+    queryset = model.objects.filter(user=user, **{f'{field}__in': ids})
+    present = set(queryset.values_list(field, flat=True))
+    missing = set(ids) - present
+    if missing:
+        missing -= set(target.objects.filter(
+            pk__in=missing
+        ).order_by().values_list('pk', flat=True))
+    if present:
+        # Обычный delete() отправил бы сигналы по каждой записи.
+        write_links(model, user.pk, list(present), add=False)
+        changed(model, user.pk, present, added=False)
+    return {
+        pk: (REMOVED if pk in present
+             else NOT_FOUND if pk in missing
+             else ABSENT)
+        for pk in ids
+    }
@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from .models import Tag
+
+CATALOG_KEY = 'catalog:{name}'
+TAG_SLUGS_KEY = 'catalog:tags:slugs'
+
+
+def invalidate_catalog(name):
+    """Сбрасывает закэшированный каталог."""
+    cache.delete(CATALOG_KEY.format(name=name))
+    if name == 'tags':
+        cache.delete(TAG_SLUGS_KEY)
+
+
+def get_tag_ids(slugs):
+    """Id тегов по слагам, неизвестные слаги пропускаются."""
+    tag_ids = cache.get(TAG_SLUGS_KEY)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(TAG_SLUGS_KEY, tag_ids, None)
+    return {tag_ids[slug] for slug in slugs if slug in tag_ids}
+
+
+def make_entry(content):
+    """Готовый ответ: JSON, его gzip-версия, ETag и дата."""
+    return {
+        'content': content,
+        'gzip': gzip.compress(content),
+        'etag': f'"{hashlib.sha1(content).hexdigest()}"',
+        'last_modified': int(time.time()),
+    }
+
+
+def get_catalog(name, build):
+    """Закэшированный ответ каталога."""
+    key = CATALOG_KEY.format(name=name)
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = make_entry(JSONRenderer().render(build()))
+        cache.set(key, catalog, None)
+    return catalog
+
+
+def set_cache_headers(response, max_age=0, vary=()):
+    """Публичный ответ: max_age секунд или проверка по ETag каждый раз."""
+    if max_age:
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    patch_vary_headers(response, ('Accept-Encoding', *vary))
+
+
+def catalog_response(request, catalog, max_age=0, vary=()):
+    """Ответ с учетом If-None-Match/If-Modified-Since и Accept-Encoding."""
+    response = get_conditional_response(
+        request,
+        etag=catalog['etag'],
+        last_modified=catalog['last_modified'],
+    )
+    if response is None:
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if 'gzip' in accept_encoding:
+            response = HttpResponse(
+                catalog['gzip'], content_type='application/json'
+            )
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(
+                catalog['content'], content_type='application/json'
+            )
+    response['ETag'] = catalog['etag']
+    response['Last-Modified'] = http_date(catalog['last_modified'])
+    set_cache_headers(response, max_age, vary)
+    return response
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+    """Несколько процессов сервера должны видеть один кэш."""
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_CACHES:
+        return []
+    return [Warning(
+        'Кэш по умолчанию живет в памяти одного процесса.',
+        hint=('Задачи выгрузки списка покупок, отзыв токенов и сброс '
+              'публичного кэша рецептов не дойдут до других процессов. '
+              'Задайте CACHE_BACKEND и CACHE_LOCATION, например memcached.'),
+        id='api.W001',
+    )]
@@ -0,0 +1,158 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from .models import NumberIngredient
+
+VERSION_KEY = 'recipes:ingredients:version'
+CHANGE_KEY = 'recipes:ingredients:change:{number}'
+CHANGE_TIMEOUT = 60 * 60 * 24
+MAX_CHANGES = 1000
+
+
+def mark_recipe_changed(recipe_id):
+    """Записывает в общий журнал, что состав рецепта изменился."""
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        number = cache.incr(VERSION_KEY)
+    except ValueError:
+        return
+    cache.set(CHANGE_KEY.format(number=number), recipe_id, CHANGE_TIMEOUT)
+
+
+def invalidate_recipe_index():
+    """Заставляет все процессы перестроить индекс целиком.
+
+    Нужна после массовой загрузки, которая идет мимо сигналов.
+    """
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        cache.incr(VERSION_KEY, MAX_CHANGES + 1)
+    except ValueError:
+        pass
+
+
+class Snapshot:
+    """Обратный индекс: ингредиент -> отсортированный массив рецептов."""
+
+    def __init__(self, version, postings, recipes):
+        self.version = version
+        self.postings = postings
+        self.recipes = recipes
+
+    @classmethod
+    def build(cls, version):
+        postings = defaultdict(list)
+        recipes = defaultdict(list)
+        rows = NumberIngredient.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id')
+        for ingredient_id, recipe_id in rows.iterator():
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        return cls(
+            version,
+            {key: array('l', value) for key, value in postings.items()},
+            {key: tuple(value) for key, value in recipes.items()},
+        )
+
+    def apply(self, version, recipe_ids):
+        """Новый снимок с перечитанным из базы составом рецептов.
+
+        Копируются только массивы затронутых ингредиентов, остальные
+        разделяются со старым снимком.
+        """
+        postings = dict(self.postings)
+        recipes = dict(self.recipes)
+        fresh = defaultdict(list)
+        rows = NumberIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows:
+            fresh[recipe_id].append(ingredient_id)
+        copied = set()
+
+        def posting(ingredient_id):
+            if ingredient_id not in copied:
+                postings[ingredient_id] = array(
+                    'l', postings.get(ingredient_id, ())
+                )
+                copied.add(ingredient_id)
+            return postings[ingredient_id]
+
+        for recipe_id in recipe_ids:
+            for ingredient_id in recipes.pop(recipe_id, ()):
+                items = posting(ingredient_id)
+                position = bisect_left(items, recipe_id)
+                if position < len(items) and items[position] == recipe_id:
+                    items.pop(position)
+            ingredient_ids = fresh.get(recipe_id)
+            if not ingredient_ids:
+                continue
+            recipes[recipe_id] = tuple(ingredient_ids)
+            for ingredient_id in ingredient_ids:
+                items = posting(ingredient_id)
+                items.insert(bisect_left(items, recipe_id), recipe_id)
+        return Snapshot(version, postings, recipes)
+
+
+class RecipeIngredientIndex:
+    """Поиск рецептов по имеющимся продуктам.
+
+    Индекс живет в памяти процесса и догоняет изменения по журналу в
+    общем кэше; если журнал потерян или слишком длинный, индекс
+    строится заново.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def search(self, ingredient_ids, missing=0):
+        """Id рецептов, которым не хватает не больше missing продуктов.
+
+        Сначала рецепты с большей долей имеющихся продуктов.
+        """
+        snapshot = self._get_snapshot()
+        hits = defaultdict(int)
+        for ingredient_id in set(ingredient_ids):
+            for recipe_id in snapshot.postings.get(ingredient_id, ()):
+                hits[recipe_id] += 1
+        found = []
+        for recipe_id, count in hits.items():
+            total = len(snapshot.recipes[recipe_id])
+            if total - count <= missing:
+                found.append((-count / total, total - count, -recipe_id))
+        found.sort()
+        return [-recipe_id for _, _, recipe_id in found]
+
+    def _get_snapshot(self):
+        version = cache.get(VERSION_KEY, 0)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = self._refresh(snapshot, version)
+                self._snapshot = snapshot
+        return snapshot
+
+    def _refresh(self, snapshot, version):
+        if (snapshot is None
+                or not 0 < version - snapshot.version <= MAX_CHANGES):
+            return Snapshot.build(version)
+        keys = [
+            CHANGE_KEY.format(number=number)
+            for number in range(snapshot.version + 1, version + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return Snapshot.build(version)
+        return snapshot.apply(version, set(changes.values()))
+
+
+recipe_index = RecipeIngredientIndex()
@@ -0,0 +1,53 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import FavoriteRecipe, Follow, Recipe, ShoppingList
+
+User = get_user_model()
+
+# Модель-источник, поле связи, модель со счетчиком и поле счетчика.
+COUNTERS = (
+    (FavoriteRecipe, 'recipe', Recipe, 'favorites_count'),
+    (ShoppingList, 'recipe', Recipe, 'shopping_cart_count'),
+    (Follow, 'author', User, 'followers_count'),
+    (Recipe, 'author', User, 'recipes_count'),
+)
+
+
+def change_counter(model, field, pk, delta):
+    """Атомарно меняет счетчик, не опуская его ниже нуля."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def count_subquery(source, relation):
+    return Coalesce(Subquery(
+        source.objects.filter(
+            **{relation: OuterRef('pk')}
+        ).order_by().values(relation).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def recount():
+    """Пересчитывает все счетчики, по одному UPDATE на модель."""
+    updates = defaultdict(dict)
+    for source, relation, target, field in COUNTERS:
+        updates[target][field] = count_subquery(source, relation)
+    for target, fields in updates.items():
+        target.objects.update(**fields)
+
+
+def recount_for(source, pks):
+    """Пересчитывает счетчики, которые ведет source, у объектов pks."""
+    for model, relation, target, field in COUNTERS:
+        if model is source:
+            target.objects.filter(pk__in=pks).update(
+                **{field: count_subquery(source, relation)}
+            )
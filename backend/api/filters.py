@@ -1,24 +1,49 @@
+from django import forms
 from django_filters.rest_framework import filters
 from django_filters import FilterSet
 from django.contrib.auth import get_user_model
-from rest_framework.filters import SearchFilter
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ParseError
 
-from .models import Recipe, Tag
+from .catalogs import get_tag_ids
+from .models import Recipe
+from .search import search_recipes
 
 User = get_user_model()
 
 
-class IngredientNameFilter(SearchFilter):
-    search_param = 'name'
+class SlugListField(forms.Field):
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+
+class SlugListFilter(filters.Filter):
+    """Список слагов из повторяющегося параметра, без выборки choices."""
+
+    field_class = SlugListField
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = SlugListFilter(method='filter_tags')
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
+
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов, без повторов строк."""
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids(value)
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'), tag_id__in=tag_ids
+        )))
 
     def filter_is_favorited(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
@@ -30,6 +55,15 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shoppinglist__user=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        # Курсор сортирует по дате и потерял бы порядок релевантности.
+        if 'cursor' in self.request.query_params:
+            raise ParseError({'errors': 'Поиск нельзя сочетать с cursor.'})
+        return search_recipes(queryset, value)
+
     class Meta:
         model = Recipe
         fields = ('tags', 'author')
@@ -0,0 +1,113 @@
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, models
+from django.db.models.fields.files import ImageFieldFile
+from PIL import Image, ImageOps
+
+
+def rendition_name(name, rendition, webp=False):
+    """Имя уменьшенной копии картинки рядом с оригиналом."""
+    base, ext = os.path.splitext(name)
+    if webp:
+        ext = '.webp'
+    elif ext.lower() != '.png':
+        ext = '.jpg'
+    return f'{base}.{settings.RECIPE_IMAGE_RENDITIONS[rendition]}{ext}'
+
+
+def renditions_ready(file):
+    """Копии созданы для текущей картинки, хранилище не проверяется."""
+    return file.instance.rendered_image == file.name
+
+
+def make_renditions(file):
+    """Создает недостающие уменьшенные копии картинки и их WebP-версии."""
+    names = [
+        (rendition, webp, rendition_name(file.name, rendition, webp))
+        for rendition in settings.RECIPE_IMAGE_RENDITIONS
+        for webp in (False, True)
+    ]
+    missing = [item for item in names if not file.storage.exists(item[2])]
+    if not missing:
+        return
+    with file.storage.open(file.name) as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    for rendition, webp, name in missing:
+        width = settings.RECIPE_IMAGE_RENDITIONS[rendition]
+        copy = image.copy()
+        if copy.mode not in ('RGB', 'RGBA'):
+            copy = copy.convert('RGBA')
+        copy.thumbnail((width, width), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if webp:
+            copy.save(buffer, 'WEBP', quality=80, method=4)
+        elif name.endswith('.png'):
+            copy.save(buffer, 'PNG', optimize=True)
+        else:
+            copy.convert('RGB').save(buffer, 'JPEG', quality=85,
+                                     optimize=True, progressive=True)
+        file.storage.save(name, ContentFile(buffer.getvalue()))
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.RECIPE_IMAGE_WORKERS,
+        thread_name_prefix='recipe-image',
+    )
+
+
+def run_in_background(func, *args):
+    """Запускает обработку картинки вне потока запроса."""
+    if not settings.RECIPE_IMAGE_WORKERS:
+        func(*args)
+        return
+    get_executor().submit(_run_and_close, func, *args)
+
+
+def _run_and_close(func, *args):
+    try:
+        func(*args)
+    finally:
+        connection.close()
+
+
+class ContentHashImageFieldFile(ImageFieldFile):
+    """Файл, который сохраняется под хэшем своего содержимого.
+
+    Повторная загрузка той же картинки не создает новый файл, а имена
+    никогда не переиспользуются, поэтому их можно кэшировать навсегда.
+    """
+
+    def save(self, name, content, save=True):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+        name = self.field.generate_filename(
+            self.instance, f'{digest[:2]}/{digest}{ext}'
+        )
+        if not self.storage.exists(name):
+            name = self.storage.save(
+                name, content, max_length=self.field.max_length
+            )
+        self.name = name
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = True
+        if save:
+            self.instance.save()
+
+    save.alters_data = True
+
+
+class ContentHashImageField(models.ImageField):
+    attr_class = ContentHashImageFieldFile
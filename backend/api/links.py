@@ -0,0 +1,107 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.http import Http404
+
+from .counters import recount_for
+from .models import FavoriteRecipe, Follow, Recipe, ShoppingList
+from .relations import bump_relations_version
+from .shopping_cart import bump_cart_version
+from .timeline import backfill, drop_authors
+
+User = get_user_model()
+
+# Модель связи, поле цели и модель цели.
+TARGETS = {
+    FavoriteRecipe: ('recipe_id', Recipe),
+    ShoppingList: ('recipe_id', Recipe),
+    Follow: ('author_id', User),
+}
+
+
+def target_pk(model, pk):
+    """id цели из URL или 404, как у get_object_or_404."""
+    _, target = TARGETS[model]
+    try:
+        return target._meta.pk.to_python(pk)
+    except ValidationError:
+        raise Http404
+
+
+def changed(model, user_id, ids, added):
+    """То, что при записи через ORM делают сигналы.
+
+    write_links и массовые запросы сигналов не отправляют.
+    """
+    recount_for(model, ids)
+    transaction.on_commit(lambda: bump_relations_version(user_id))
+    if model is ShoppingList:
+        transaction.on_commit(lambda: bump_cart_version(user_id))
+    if model is Follow and added:
+        backfill(user_id, ids)
+    elif model is Follow:
+        drop_authors(user_id, ids)
+
+
+def write_links(model, user_id, ids, add):
+    """Добавляет или удаляет связи пользователя с целями ids одним запросом.
+
+    Добавление — INSERT ... SELECT по существующим целям, дубликаты
+    пропускаются; удаление — DELETE. Первым в транзакции запрос сразу
+    берет блокировку на запись, поэтому одновременные запросы к одной
+    паре не падают. Сигналы не отправляются: после записи вызывается
+    changed(). Возвращает число добавленных или удаленных строк.
+    """
+    attname, target = TARGETS[model]
+    ops = connection.ops
+    table = ops.quote_name(model._meta.db_table)
+    user_column = ops.quote_name(model._meta.get_field('user').column)
+    target_column = ops.quote_name(model._meta.get_field(attname).column)
+    placeholders = ', '.join(['%s'] * len(ids))
+    if add:
+        obj = model(user_id=user_id)
+        columns, select, params = [target_column], [], []
+        for field in model._meta.concrete_fields:
+            if field.primary_key or field.attname == attname:
+                continue
+            columns.append(ops.quote_name(field.column))
+            select.append('%s')
+            params.append(field.get_db_prep_save(
+                field.pre_save(obj, add=True), connection
+            ))
+        pk_column = ops.quote_name(target._meta.pk.column)
+        sql = (
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            f'{table} ({", ".join(columns)}) '
+            f'SELECT {", ".join([pk_column, *select])} '
+            f'FROM {ops.quote_name(target._meta.db_table)} '
+            f'WHERE {pk_column} IN ({placeholders}) '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+        )
+    else:
+        sql = (
+            f'DELETE FROM {table} '
+            f'WHERE {user_column} = %s AND {target_column} IN ({placeholders})'
+        )
+        params = [user_id]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (*params, *ids))
+        return cursor.rowcount
+
+
+def add_link(model, user, pk):
+    """Создает связь, возвращает False, если она уже есть или цели нет."""
+    pk = target_pk(model, pk)
+    if not write_links(model, user.pk, [pk], add=True):
+        return False
+    changed(model, user.pk, [pk], added=True)
+    return True
+
+
+def remove_link(model, user, pk):
+    """Удаляет связь, возвращает False, если ее не было."""
+    pk = target_pk(model, pk)
+    if not write_links(model, user.pk, [pk], add=False):
+        return False
+    changed(model, user.pk, [pk], added=False)
+    return True
@@ -0,0 +1,123 @@
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from .bench_endpoints import Command as BenchEndpoints
+
+ENDPOINTS = (
+    'recipes-list', 'recipes-list-tags', 'recipes-detail',
+    'users-subscriptions', 'ingredients-search',
+)
+
+
+class Command(BaseCommand):
+    """Нагрузка на запущенный сервер несколькими клиентами сразу.
+
+    Один и тот же прогон против WSGI и ASGI показывает разницу
+    в пропускной способности.
+    """
+
+    help = ('Замеряет запросы в секунду и p50/p95 на запущенном сервере '
+            'при одновременных клиентах')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Адрес запущенного сервера',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=16,
+            help='Число одновременных клиентов',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=400,
+            help='Всего запросов на каждый эндпоинт',
+        )
+        parser.add_argument(
+            '--only', nargs='+', default=None,
+            help='Замерить только эти эндпоинты',
+        )
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument(
+            '--compare', help='JSON предыдущего запуска для сравнения'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('Нужно хотя бы два запроса.')
+        bench = BenchEndpoints()
+        user = bench.get_user()
+        token, _ = Token.objects.get_or_create(user=user)
+        names = options['only'] or ENDPOINTS
+        endpoints = [(name, url) for name, url, before
+                     in bench.get_endpoints(user)
+                     if name in names and before is None]
+        headers = {
+            'Authorization': f'Token {token.key}',
+            'Accept': 'application/json',
+        }
+        results = {}
+        for name, url in endpoints:
+            results[name] = self.measure(
+                options['url'].rstrip('/') + url, headers,
+                options['concurrency'], options['requests'],
+            )
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['results']
+        self.report(results, previous)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'commit': bench.get_commit(),
+                    'url': options['url'],
+                    'concurrency': options['concurrency'],
+                    'requests': options['requests'],
+                    'results': results,
+                }, file, ensure_ascii=False, indent=2)
+
+    def measure(self, url, headers, concurrency, total):
+        def fetch(_):
+            start = time.perf_counter()
+            try:
+                with urlopen(Request(url, headers=headers)) as response:
+                    response.read()
+            except HTTPError as error:
+                raise CommandError(f'{url}: {error.code}')
+            return (time.perf_counter() - start) * 1000
+
+        # Прогрев: по запросу на каждого клиента.
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(fetch, range(concurrency)))
+            start = time.perf_counter()
+            timings = list(executor.map(fetch, range(total)))
+            elapsed = time.perf_counter() - start
+        return {
+            'url': url,
+            'rps': round(total / elapsed, 1),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(statistics.quantiles(
+                timings, n=20, method='inclusive'
+            )[-1], 2),
+            'max_ms': round(max(timings), 2),
+        }
+
+    def report(self, results, previous):
+        for name, result in results.items():
+            line = (f'{name:<24} rps={result["rps"]:8.1f} '
+                    f'p50={result["p50_ms"]:8.2f}ms '
+                    f'p95={result["p95_ms"]:8.2f}ms')
+            old = previous.get(name)
+            if old:
+                change = (result['rps'] / old['rps'] - 1) * 100
+                line += f' rps {change:+6.1f}%'
+            self.stdout.write(line)
@@ -0,0 +1,158 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import Ingredient, Recipe, ShoppingList, Tag
+from api.shopping_cart import bump_cart_version
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Замер основных эндпоинтов на данных из seed_data."""
+
+    help = ('Замеряет p50/p95 и число запросов для горячих эндпоинтов '
+            'и сохраняет результат в JSON для сравнения между коммитами')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Незамеряемых запросов перед замером',
+        )
+        parser.add_argument(
+            '--only', nargs='+', default=None,
+            help='Замерить только эти эндпоинты',
+        )
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument(
+            '--compare', help='JSON предыдущего запуска для сравнения'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 2:
+            raise CommandError('Нужно хотя бы два повтора.')
+        user = self.get_user()
+        client = APIClient()
+        client.force_authenticate(user)
+        endpoints = self.get_endpoints(user)
+        if options['only']:
+            endpoints = [item for item in endpoints
+                         if item[0] in options['only']]
+        results = {}
+        for name, url, before in endpoints:
+            results[name] = self.measure(
+                client, url, before, options['warmup'], options['repeat']
+            )
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['results']
+        self.report(results, previous)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'commit': self.get_commit(),
+                    'python': platform.python_version(),
+                    'database': connection.vendor,
+                    'data': {
+                        'users': User.objects.count(),
+                        'recipes': Recipe.objects.count(),
+                        'ingredients': Ingredient.objects.count(),
+                    },
+                    'repeat': options['repeat'],
+                    'results': results,
+                }, file, ensure_ascii=False, indent=2)
+
+    def get_user(self):
+        """Пользователь с самым большим списком покупок."""
+        row = ShoppingList.objects.values('user').annotate(
+            total=Count('id')
+        ).order_by('-total').first()
+        if row is None:
+            raise CommandError('Нет данных, сначала выполните seed_data.')
+        return User.objects.get(pk=row['user'])
+
+    def get_endpoints(self, user):
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        ingredient = Ingredient.objects.order_by('id').first()
+        tags = '&'.join(f'tags={slug}' for slug in slugs)
+
+        def cold_cart():
+            bump_cart_version(user.id)
+
+        return [
+            ('recipes-list', '/api/recipes/?limit=6', None),
+            ('recipes-list-tags', f'/api/recipes/?limit=6&{tags}', None),
+            ('recipes-list-favorited',
+             '/api/recipes/?limit=6&is_favorited=1', None),
+            ('recipes-search', '/api/recipes/?limit=6&search=суп', None),
+            ('recipes-detail', f'/api/recipes/{recipe.id}/', None),
+            ('recipes-feed', '/api/recipes/feed/?limit=6', None),
+            ('users-subscriptions',
+             '/api/users/subscriptions/?limit=6&recipes_limit=3', None),
+            ('ingredients-search',
+             f'/api/ingredients/?name={ingredient.name[:3]}', None),
+            ('shopping-cart-pdf',
+             '/api/recipes/download_shopping_cart/', None),
+            ('shopping-cart-pdf-cold',
+             '/api/recipes/download_shopping_cart/', cold_cart),
+            ('shopping-cart-txt-cold',
+             '/api/recipes/download_shopping_cart/?type=txt', cold_cart),
+        ]
+
+    def measure(self, client, url, before, warmup, repeat):
+        for _ in range(warmup):
+            client.get(url)
+        timings = []
+        for _ in range(repeat):
+            if before is not None:
+                before()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: {response.status_code}')
+        return {
+            'url': url,
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(statistics.quantiles(
+                timings, n=20, method='inclusive'
+            )[-1], 2),
+            'max_ms': round(max(timings), 2),
+            'queries': len(context.captured_queries),
+        }
+
+    def report(self, results, previous):
+        for name, result in results.items():
+            line = (f'{name:<24} p50={result["p50_ms"]:8.2f}ms '
+                    f'p95={result["p95_ms"]:8.2f}ms '
+                    f'queries={result["queries"]:<3}')
+            old = previous.get(name)
+            if old:
+                change = (result['p50_ms'] / old['p50_ms'] - 1) * 100
+                line += (f' p50 {change:+6.1f}% '
+                         f'queries {result["queries"] - old["queries"]:+d}')
+            self.stdout.write(line)
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ('git', 'rev-parse', '--short', 'HEAD'),
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,113 @@
+import base64
+import io
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.models import Ingredient, Tag
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Замер скорости создания и изменения рецептов через API."""
+
+    help = ('Замеряет время и число запросов POST/PATCH /api/recipes/ '
+            'для рецептов с разным количеством ингредиентов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[5, 50, 200],
+            help='Количество ингредиентов в рецепте',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Повторов для каждого размера',
+        )
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                self.run(options)
+        finally:
+            shutil.rmtree(media_root)
+
+    def run(self, options):
+        with transaction.atomic():
+            user, tags, ingredients = self.prepare(max(options['sizes']))
+            client = APIClient()
+            client.force_authenticate(user)
+            image = self.make_image()
+            for size in options['sizes']:
+                for method in ('post', 'patch'):
+                    timings, queries = self.measure(
+                        client, method, options['repeat'], {
+                            'name': f'bench recipe {size}',
+                            'text': 'bench',
+                            'cooking_time': 10,
+                            'image': image,
+                            'tags': tags,
+                            'ingredients': [
+                                {'id': ingredient_id, 'amount': 10}
+                                for ingredient_id in ingredients[:size]
+                            ],
+                        })
+                    self.stdout.write(
+                        f'{method.upper():<5} ingredients={size:<4} '
+                        f'median={statistics.median(timings):8.1f}ms '
+                        f'max={max(timings):8.1f}ms '
+                        f'queries={queries}'
+                    )
+            transaction.set_rollback(True)
+
+    def prepare(self, size):
+        user = User.objects.create_user(
+            username='bench_write', email='bench_write@foodgram.ru',
+        )
+        Tag.objects.bulk_create(
+            Tag(name=f'bench tag {i}', color=f'#FFFFF{i}', slug=f'bench{i}')
+            for i in range(3)
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench ingredient {i}', measure='г')
+            for i in range(size)
+        )
+        tags = list(Tag.objects.filter(
+            slug__startswith='bench'
+        ).values_list('id', flat=True))
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='bench ingredient '
+        ).values_list('id', flat=True))
+        return user, tags, ingredients
+
+    def make_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), '#c06030').save(buffer, 'JPEG')
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        return f'data:image/jpeg;base64,{encoded}'
+
+    def measure(self, client, method, repeat, payload):
+        timings = []
+        url = '/api/recipes/'
+        if method == 'patch':
+            response = client.post(url, payload, format='json')
+            url = f'/api/recipes/{response.data["id"]}/'
+        for _ in range(repeat):
+            if method == 'patch':
+                # Меняем количество одного ингредиента, как при правке.
+                payload['ingredients'][0]['amount'] += 1
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = getattr(client, method)(url, payload, format='json')
+                timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code in (200, 201), response.content
+        return timings, len(context.captured_queries)
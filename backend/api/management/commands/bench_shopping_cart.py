@@ -0,0 +1,92 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import Ingredient, NumberIngredient, Recipe, ShoppingList
+from api.shopping_cart import bump_cart_version
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Замер скорости выгрузки списка покупок."""
+
+    help = 'Замеряет время download_shopping_cart для корзин разного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10, 100, 1000],
+            help='Количество рецептов в корзине',
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=10,
+            help='Ингредиентов в одном рецепте',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Повторов для каждого размера',
+        )
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            with transaction.atomic():
+                user = self.fill_cart(size, options['ingredients'])
+                timings, queries = self.measure(user, options['repeat'])
+                transaction.set_rollback(True)
+            self.stdout.write(
+                f'recipes={size:<6} '
+                f'median={statistics.median(timings):8.1f}ms '
+                f'max={max(timings):8.1f}ms '
+                f'queries={queries}'
+            )
+
+    def fill_cart(self, size, per_recipe):
+        user = User.objects.create_user(
+            username='bench_cart', email='bench_cart@foodgram.ru',
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench ingredient {i}', measure='г')
+            for i in range(per_recipe * 5)
+        )
+        Recipe.objects.bulk_create(
+            Recipe(author=user, name=f'bench recipe {i}', text='bench',
+                   cooking_time=10, image='recipes/bench.png')
+            for i in range(size)
+        )
+        # SQLite не возвращает первичные ключи из bulk_create.
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='bench ingredient '
+        ))
+        recipes = list(Recipe.objects.filter(author=user))
+        NumberIngredient.objects.bulk_create(
+            NumberIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(i + j) % len(ingredients)],
+                amount=j + 1,
+            )
+            for i, recipe in enumerate(recipes)
+            for j in range(per_recipe)
+        )
+        ShoppingList.objects.bulk_create(
+            ShoppingList(user=user, recipe=recipe) for recipe in recipes
+        )
+        return user
+
+    def measure(self, user, repeat):
+        client = APIClient()
+        client.force_authenticate(user)
+        timings = []
+        for _ in range(repeat):
+            # Замеряем построение выгрузки, а не чтение из кэша.
+            bump_cart_version(user.id)
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get('/api/recipes/download_shopping_cart/')
+                timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+        return timings, len(context.captured_queries)
@@ -0,0 +1,101 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.autocomplete import ingredient_index
+from api.catalogs import invalidate_catalog
+from api.models import Ingredient
+
+CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Строки CSV вида `название,единица измерения`."""
+    for row in csv.reader(file):
+        if len(row) != 2:
+            continue
+        yield row[0], row[1]
+
+
+def read_json(file):
+    """Потоково разбирает JSON-массив объектов с name и measurement_unit."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in '[, \t\r\n':
+                position += 1
+            if position == len(buffer) or buffer[position] == ']':
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+class Command(BaseCommand):
+    """Загрузка каталога ингредиентов из data/ingredients.(csv|json)."""
+
+    help = 'Загружает ингредиенты из CSV или JSON файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу с ингредиентами')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла, по умолчанию берется из расширения',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одном INSERT',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        )
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла: {path}. '
+                'Укажите --format csv или --format json.'
+            )
+        start = time.perf_counter()
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            before = Ingredient.objects.count()
+            rows = self.load(READERS[file_format](file), options['batch_size'])
+            created = Ingredient.objects.count() - before
+        if created:
+            ingredient_index.invalidate()
+            invalidate_catalog('ingredients')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {rows}, добавлено {created} ингредиентов '
+            f'за {elapsed:.3f} с ({rows / elapsed:.0f} строк/с)'
+        ))
+
+    def load(self, items, batch_size):
+        rows = 0
+        while True:
+            batch = [
+                Ingredient(name=name.strip(), measure=measure.strip())
+                for name, measure in islice(items, batch_size)
+            ]
+            if not batch:
+                return rows
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            rows += len(batch)
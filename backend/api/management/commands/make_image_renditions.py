@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from api.images import make_renditions
+from api.models import Recipe
+from api.public_cache import bump_public_version
+
+
+class Command(BaseCommand):
+    """Создание уменьшенных копий для уже загруженных картинок."""
+
+    help = 'Создает недостающие уменьшенные копии картинок рецептов'
+
+    def handle(self, *args, **options):
+        processed = 0
+        names = Recipe.objects.exclude(image='').exclude(
+            rendered_image=F('image')
+        ).values_list('image', flat=True).order_by().distinct()
+        for name in names:
+            try:
+                make_renditions(Recipe(image=name).image)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f'{name}: {error}')
+                continue
+            Recipe.objects.filter(image=name).update(rendered_image=name)
+            processed += 1
+        if processed:
+            bump_public_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {processed}'
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    """Перестройка лент подписок."""
+
+    help = 'Заполняет ленты подписок заново по текущим подпискам'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic():
+            rebuild_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты перестроены за {time.perf_counter() - start:.3f} с'
+        ))
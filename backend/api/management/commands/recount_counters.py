@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import recount
+
+
+class Command(BaseCommand):
+    """Сверка денормализованных счетчиков с фактическими данными."""
+
+    help = ('Пересчитывает счетчики избранного, списков покупок, '
+            'рецептов и подписчиков')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic():
+            recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики пересчитаны за {time.perf_counter() - start:.3f} с'
+        ))
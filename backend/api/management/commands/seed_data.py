@@ -0,0 +1,238 @@
+import io
+import random
+import time
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image
+
+from api.autocomplete import ingredient_index
+from api.catalogs import invalidate_catalog
+from api.cookbook import invalidate_recipe_index
+from api.counters import recount
+from api.images import make_renditions
+from api.models import (FavoriteRecipe, Follow, Ingredient, NumberIngredient,
+                        Recipe, ShoppingList, Tag)
+from api.public_cache import bump_public_version
+from api.search import reindex_recipes
+from api.timeline import rebuild_timelines
+
+User = get_user_model()
+
+PREFIX = 'seed_'
+PASSWORD = 'seed-password'
+BATCH_SIZE = 1000
+DISHES = ('суп', 'борщ', 'салат', 'пирог', 'каша', 'омлет', 'рагу',
+          'паста', 'котлеты', 'блины', 'запеканка', 'плов')
+ADJECTIVES = ('домашний', 'быстрый', 'летний', 'острый', 'сырный',
+              'овощной', 'куриный', 'грибной', 'рыбный', 'постный')
+MEASURES = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+class Command(BaseCommand):
+    """Наполнение базы синтетическими данными для замеров."""
+
+    help = ('Создает пользователей, рецепты, избранное, списки покупок '
+            'и подписки с неравномерной популярностью')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument(
+            '--ingredients', type=int, default=1000,
+            help='Минимальный размер справочника ингредиентов',
+        )
+        parser.add_argument(
+            '--per-recipe', type=int, default=8,
+            help='Среднее число ингредиентов в рецепте',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число избранных рецептов у пользователя',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Среднее число рецептов в списке покупок',
+        )
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Среднее число подписок у пользователя',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить данные предыдущего запуска',
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.skew = options['skew']
+        self._weights = {}
+        start = time.perf_counter()
+        if options['clear']:
+            User.objects.filter(username__startswith=PREFIX).delete()
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            tags = self.ensure_tags()
+            ingredients = self.ensure_ingredients(options['ingredients'])
+            recipes = self.create_recipes(users, options['recipes'])
+            self.create_recipe_links(
+                recipes, tags, ingredients, options['per_recipe']
+            )
+            self.create_relations(users, recipes, options)
+            recount()
+            rebuild_timelines()
+        reindex_recipes()
+        invalidate_recipe_index()
+        ingredient_index.invalidate()
+        invalidate_catalog('ingredients')
+        invalidate_catalog('tags')
+        bump_public_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)} '
+            f'за {time.perf_counter() - start:.1f} с. '
+            f'Пароль пользователей: {PASSWORD}'
+        ))
+
+    def skewed(self, items, count):
+        """Выборка без повторов, где первые элементы популярнее."""
+        count = min(count, len(items))
+        weights = self.weights(len(items))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(self.random.choices(
+                items, cum_weights=weights, k=count - len(chosen)
+            ))
+        return chosen
+
+    def weights(self, size):
+        if size not in self._weights:
+            self._weights[size] = list(accumulate(
+                1 / (rank + 1) ** self.skew for rank in range(size)
+            ))
+        return self._weights[size]
+
+    def around(self, average):
+        return self.random.randint(0, 2 * average)
+
+    def create_users(self, count):
+        offset = User.objects.filter(username__startswith=PREFIX).count()
+        password = make_password(PASSWORD)
+        User.objects.bulk_create((
+            User(
+                username=f'{PREFIX}{number}',
+                email=f'{PREFIX}{number}@foodgram.ru',
+                first_name='Повар',
+                last_name=str(number),
+                password=password,
+            )
+            for number in range(offset, offset + count)
+        ), batch_size=BATCH_SIZE)
+        return list(User.objects.filter(
+            username__startswith=PREFIX
+        ).order_by('id').values_list('id', flat=True))[offset:]
+
+    def ensure_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def ensure_ingredients(self, count):
+        missing = count - Ingredient.objects.count()
+        if missing > 0:
+            Ingredient.objects.bulk_create((
+                Ingredient(
+                    name=f'{PREFIX}ингредиент {number}',
+                    measure=self.random.choice(MEASURES),
+                )
+                for number in range(missing)
+            ), batch_size=BATCH_SIZE, ignore_conflicts=True)
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def make_image(self, author_id):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 900), '#c06030').save(buffer, 'JPEG')
+        recipe = Recipe(author_id=author_id)
+        recipe.image.save(
+            'seed.jpg', ContentFile(buffer.getvalue()), save=False
+        )
+        make_renditions(recipe.image)
+        return recipe.image.name
+
+    def create_recipes(self, users, count):
+        image = self.make_image(users[0])
+        # Несколько активных авторов пишут большую часть рецептов.
+        authors = self.weights(len(users))
+        first = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        Recipe.objects.bulk_create((
+            Recipe(
+                author_id=self.random.choices(users, cum_weights=authors)[0],
+                name=(f'{self.random.choice(ADJECTIVES).capitalize()} '
+                      f'{self.random.choice(DISHES)} {number}'),
+                text=' '.join(self.random.choices(
+                    DISHES + ADJECTIVES, k=30
+                )),
+                cooking_time=self.random.randint(5, 180),
+                image=image,
+            )
+            for number in range(count)
+        ), batch_size=BATCH_SIZE)
+        return list(Recipe.objects.filter(
+            id__gt=first, author_id__in=users
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipe_links(self, recipes, tags, ingredients, per_recipe):
+        through = Recipe.tags.through
+        through.objects.bulk_create((
+            through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipes
+            for tag_id in self.random.sample(
+                tags, self.random.randint(1, len(tags))
+            )
+        ), batch_size=BATCH_SIZE)
+        NumberIngredient.objects.bulk_create((
+            NumberIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.random.randint(1, 500),
+            )
+            for recipe_id in recipes
+            for ingredient_id in self.skewed(
+                ingredients, max(1, self.around(per_recipe))
+            )
+        ), batch_size=BATCH_SIZE)
+
+    def create_relations(self, users, recipes, options):
+        # Старые рецепты популярнее новых.
+        for model, average in ((FavoriteRecipe, options['favorites']),
+                               (ShoppingList, options['carts'])):
+            model.objects.bulk_create((
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in users
+                for recipe_id in self.skewed(recipes, self.around(average))
+            ), batch_size=BATCH_SIZE, ignore_conflicts=True)
+        follows = options['follows']
+        Follow.objects.bulk_create((
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in users
+            for author_id in self.skewed(users, self.around(follows))
+            if author_id != user_id
+        ), batch_size=BATCH_SIZE, ignore_conflicts=True)
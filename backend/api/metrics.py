@@ -0,0 +1,221 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+TIME_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+HISTOGRAMS = (
+    ('request_duration_seconds', 'Полное время ответа', TIME_BUCKETS),
+    ('db_duration_seconds', 'Время SQL-запросов', TIME_BUCKETS),
+    ('db_queries', 'Число SQL-запросов', COUNT_BUCKETS),
+    ('render_duration_seconds', 'Время рендеринга JSON', TIME_BUCKETS),
+)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name, view):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield f'{name}_bucket{{view="{view}",le="{bound}"}} {total}'
+        yield f'{name}_sum{{view="{view}"}} {self.sum}'
+        yield f'{name}_count{{view="{view}"}} {total}'
+
+
+class Registry:
+    """Гистограммы по представлениям в памяти процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, values):
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = {
+                    name: Histogram(buckets)
+                    for name, _, buckets in HISTOGRAMS
+                }
+            for name, value in values.items():
+                histograms[name].observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, help_text, _ in HISTOGRAMS:
+                metric = f'foodgram_{name}'
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for view, histograms in sorted(self._views.items()):
+                    lines.extend(histograms[name].lines(metric, view))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    """Число и время SQL-запросов и время рендеринга одного ответа.
+
+    Запросы ответа могут одновременно идти из нескольких потоков.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.duration = 0
+        self.render = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.duration += duration
+                self.count += 1
+
+
+# Метрики текущего запроса; sync_to_async передает их в другие потоки.
+current_metrics = ContextVar('request_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_wrapper(connection, **kwargs):
+    """Учитывает запросы соединения в метриках запроса любого потока."""
+    # В начало списка: execute_wrapper() снимает последнюю обертку.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def install_query_wrappers(**kwargs):
+    """Соединения, открытые до включения метрик.
+
+    request_started приходит в том же потоке, где работают синхронные
+    представления, и в WSGI, и в ASGI.
+    """
+    for connection in connections.all():
+        install_query_wrapper(connection)
+
+
+class MetricsJSONRenderer(JSONRenderer):
+    """JSON-рендерер, который засекает время рендеринга ответа."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        start = time.perf_counter()
+        try:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        finally:
+            metrics.render += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Время ответа, SQL и рендеринга JSON по каждому представлению.
+
+    Работает и в синхронном, и в асинхронном режиме, без переходов
+    между потоками. Если METRICS_ENABLED и METRICS_SERVER_TIMING
+    выключены, Django исключает middleware из цепочки.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not (settings.METRICS_ENABLED or settings.METRICS_SERVER_TIMING):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(
+            install_query_wrapper, dispatch_uid='metrics_query_wrapper'
+        )
+        request_started.connect(
+            install_query_wrappers, dispatch_uid='metrics_query_wrappers'
+        )
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start, metrics = time.perf_counter(), RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.observe(request, response, start, metrics)
+
+    async def __acall__(self, request):
+        start, metrics = time.perf_counter(), RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.observe(request, response, start, metrics)
+
+    def observe(self, request, response, start, metrics):
+        total = time.perf_counter() - start
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        if settings.METRICS_ENABLED:
+            registry.observe(view, {
+                'request_duration_seconds': total,
+                'db_duration_seconds': metrics.duration,
+                'db_queries': metrics.count,
+                'render_duration_seconds': metrics.render,
+            })
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join((
+                f'db;desc="{metrics.count} queries";'
+                f'dur={metrics.duration * 1000:.1f}',
+                f'render;dur={metrics.render * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ))
+        return response
+
+
+def metrics_view(request):
+    """Гистограммы в текстовом формате Prometheus."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
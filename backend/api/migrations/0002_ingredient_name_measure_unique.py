@@ -0,0 +1,63 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:33
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """Сливает ингредиенты с одинаковыми названием и единицей измерения.
+
+    Рецепты переводятся на ингредиент с наименьшим id. Если в рецепте
+    оказывается несколько строк одного ингредиента, количества
+    складываются в одну строку.
+    """
+    Ingredient = apps.get_model('api', 'Ingredient')
+    NumberIngredient = apps.get_model('api', 'NumberIngredient')
+    groups = Ingredient.objects.values('name', 'measure').annotate(
+        total=Count('pk'), survivor=Min('pk')
+    ).filter(total__gt=1).order_by()
+    for group in groups:
+        survivor = group['survivor']
+        duplicates = list(Ingredient.objects.filter(
+            name=group['name'], measure=group['measure']
+        ).exclude(pk=survivor).values_list('pk', flat=True))
+        by_recipe = defaultdict(list)
+        for row in NumberIngredient.objects.filter(
+            ingredient_id__in=[survivor, *duplicates]
+        ).order_by('recipe_id', 'id'):
+            by_recipe[row.recipe_id].append(row)
+        for rows in by_recipe.values():
+            # Строка выжившего ингредиента первая, если она есть.
+            rows.sort(key=lambda row: row.ingredient_id != survivor)
+            kept, extra = rows[0], rows[1:]
+            if extra:
+                NumberIngredient.objects.filter(
+                    pk__in=[row.pk for row in extra]
+                ).delete()
+            kept.ingredient_id = survivor
+            kept.amount = sum(row.amount for row in rows)
+            kept.save(update_fields=('ingredient', 'amount'))
+        Ingredient.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    # Ограничение добавляется после коммита слияния: в PostgreSQL
+    # ALTER TABLE не выполняется при отложенных проверках внешних ключей.
+    atomic = False
+
+    dependencies = [
+        ('api', '0001_new_recipe_model'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicates, migrations.RunPython.noop, atomic=True
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measure'), name='ingredient_name_measure_unique'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, relation):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{relation: OuterRef('pk')}
+        ).order_by().values(relation).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    FavoriteRecipe = apps.get_model('api', 'FavoriteRecipe')
+    ShoppingList = apps.get_model('api', 'ShoppingList')
+    Follow = apps.get_model('api', 'Follow')
+    User = apps.get_model('users', 'CustomUser')
+    Recipe.objects.update(
+        favorites_count=count_subquery(FavoriteRecipe, 'recipe'),
+        shopping_cart_count=count_subquery(ShoppingList, 'recipe'),
+    )
+    User.objects.update(
+        followers_count=count_subquery(Follow, 'author'),
+        recipes_count=count_subquery(Recipe, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_recipe_counters'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:39
+
+import api.images
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_fill_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=api.images.ContentHashImageField(upload_to='recipes/', verbose_name='Картинка'),
+        ),
+    ]
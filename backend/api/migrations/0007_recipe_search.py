@@ -0,0 +1,61 @@
+from django.db import migrations
+
+POSTGRES_FORWARD = (
+    "ALTER TABLE api_recipe ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+    ") STORED",
+    'CREATE INDEX recipe_search_vector_idx ON api_recipe '
+    'USING GIN (search_vector)',
+)
+POSTGRES_BACKWARD = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'ALTER TABLE api_recipe DROP COLUMN IF EXISTS search_vector',
+)
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE api_recipe_fts USING fts5('
+    "name, text, tokenize = 'unicode61 remove_diacritics 2')",
+    'INSERT INTO api_recipe_fts (rowid, name, text) '
+    "SELECT id, replace(replace(name, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace(text, 'ё', 'е'), 'Ё', 'Е') FROM api_recipe",
+)
+SQLITE_BACKWARD = (
+    'DROP TABLE IF EXISTS api_recipe_fts',
+)
+
+
+def sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor == 'sqlite' and not sqlite_has_fts5(connection):
+            return
+        for statement in statements_by_vendor.get(connection.vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_recipe_content_hash_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({
+                'postgresql': POSTGRES_FORWARD,
+                'sqlite': SQLITE_FORWARD,
+            }),
+            run({
+                'postgresql': POSTGRES_BACKWARD,
+                'sqlite': SQLITE_BACKWARD,
+            }),
+        ),
+    ]
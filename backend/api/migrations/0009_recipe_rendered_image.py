@@ -0,0 +1,38 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+from api.images import rendition_name
+
+
+def mark_rendered(apps, schema_editor):
+    """Отмечает картинки, для которых копии уже лежат в хранилище."""
+    Recipe = apps.get_model('api', 'Recipe')
+    storage = Recipe._meta.get_field('image').storage
+    names = Recipe.objects.exclude(image='').values_list(
+        'image', flat=True
+    ).order_by().distinct()
+    for name in names:
+        if all(
+            storage.exists(rendition_name(name, rendition, webp))
+            for rendition in settings.RECIPE_IMAGE_RENDITIONS
+            for webp in (False, True)
+        ):
+            Recipe.objects.filter(image=name).update(rendered_image=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rendered_image',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Картинка, для которой созданы копии'),
+        ),
+        migrations.RunPython(mark_rendered, migrations.RunPython.noop),
+    ]
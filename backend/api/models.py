@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from users.models import CounterFieldsMixin
+
+from .images import ContentHashImageField
 
 User = get_user_model()
 
@@ -23,6 +26,12 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measure'],
+                name='ingredient_name_measure_unique',
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measure}'
@@ -58,7 +67,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецептов."""
 
     author = models.ForeignKey(
@@ -72,10 +81,16 @@ class Recipe(models.Model):
         verbose_name='Название',
         help_text='Введите название рецепта',
     )
-    image = models.ImageField(
+    image = ContentHashImageField(
         verbose_name='Картинка',
         upload_to='recipes/',
     )
+    rendered_image = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Картинка, для которой созданы копии',
+    )
     text = models.TextField(
         verbose_name='Описание',
         help_text='Введите описание рецепта',
@@ -103,11 +118,28 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации',
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False,
+    )
+
+    COUNTER_FIELDS = ('favorites_count', 'shopping_cart_count')
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -242,3 +274,44 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'Рецепт {self.recipe} в списке покупок {self.user}'
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='timeline_user_recipe_unique'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-id'],
+                name='timeline_user_pub_date_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
@@ -1,7 +1,111 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
 
 
 class CustomPagination(PageNumberPagination):
     """Пагинатор с переопределенным запрошенным количеством страниц."""
 
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная пагинация по составному ключу без COUNT и OFFSET.
+
+    Курсор хранит значения всех полей сортировки последней записи
+    страницы, следующая страница выбирается условием по этим значениям.
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        position = self.decode_position(queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False, position=self.get_position(self.page[-1])
+        ))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=True, position=self.get_position(self.page[0])
+        ))
+
+    def get_position(self, instance):
+        values = [
+            getattr(instance, field.lstrip('-')) for field in self.ordering
+        ]
+        # Даты храним целиком, с микросекундами, иначе ключ не совпадет.
+        return json.dumps([
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in values
+        ])
+
+    def decode_position(self, model):
+        if self.cursor is None or self.cursor.position is None:
+            return None
+        try:
+            values = json.loads(self.cursor.position)
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def after(ordering, values):
+        """Условие «строго после позиции» для составного ключа сортировки.
+
+        Нестрогая граница по первому полю дублирует условие, но без OR,
+        поэтому база может пройти по индексу диапазоном.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        if len(equal) > 1:
+            field, value = ordering[0], values[0]
+            lookup = 'lte' if field.startswith('-') else 'gte'
+            condition &= Q(**{f'{field.lstrip("-")}__{lookup}': value})
+        return condition
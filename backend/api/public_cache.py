@@ -0,0 +1,95 @@
+import hashlib
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .catalogs import catalog_response, make_entry, set_cache_headers
+
+VERSION_KEY = 'recipes:public:version'
+RESPONSE_KEY = 'recipes:public:{version}:{digest}'
+# Ответ анонимному пользователю не должен достаться авторизованному.
+VARY = ('Authorization',)
+# Поля автора, которые выводятся в рецептах.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+def bump_public_version():
+    """Сбрасывает все закэшированные публичные страницы рецептов."""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def public_cache_key(request):
+    """Ключ ответа анонимному пользователю или None, если кэш не нужен.
+
+    Версия читается до построения ответа: если рецепт изменится
+    во время запроса, ответ ляжет под уже устаревшую версию.
+    """
+    if (not settings.RECIPES_CACHE_TIMEOUT or request.method != 'GET'
+            or request.user.is_authenticated):
+        return None
+    query = urlencode(sorted(
+        (name, value)
+        for name, values in request.GET.lists() for value in values
+    ))
+    digest = hashlib.sha1(
+        f'{request.build_absolute_uri(request.path)}?{query}'.encode()
+    ).hexdigest()
+    version = cache.get_or_set(VERSION_KEY, uuid.uuid4().hex, None)
+    return RESPONSE_KEY.format(version=version, digest=digest)
+
+
+def lookup(request):
+    """Ключ и закэшированный ответ; (None, None), если кэш не нужен."""
+    key = public_cache_key(request)
+    if key is None:
+        return None, None
+    return key, cache.get(key)
+
+
+def store_public_response(key, content):
+    entry = make_entry(content)
+    cache.set(key, entry, settings.RECIPES_CACHE_TIMEOUT)
+    return entry
+
+
+def public_response(request, entry):
+    return catalog_response(
+        request, entry, settings.RECIPES_CACHE_MAX_AGE, VARY
+    )
+
+
+def cached_public_response(request):
+    """Ключ и ответ из кэша для запроса DRF.
+
+    (None, None), если кэш не нужен; (key, None), если ответа еще нет.
+    """
+    if request.accepted_renderer.format != 'json':
+        return None, None
+    key, entry = lookup(request)
+    if entry is None:
+        return key, None
+    return key, public_response(request, entry)
+
+
+def remember_public_response(key, response):
+    """Сохраняет успешный ответ DRF под key после рендеринга."""
+    if key is None or response.status_code != 200:
+        return response
+
+    def rendered(response):
+        entry = store_public_response(key, response.content)
+        response['ETag'] = entry['etag']
+        set_cache_headers(response, settings.RECIPES_CACHE_MAX_AGE, VARY)
+
+    response.add_post_render_callback(rendered)
+    return response
+
+
+def cache_public_response(request, view):
+    """Ответ DRF из кэша или от view с сохранением после рендеринга."""
+    key, cached = cached_public_response(request)
+    if cached is not None:
+        return cached
+    return remember_public_response(key, view())
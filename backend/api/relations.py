@@ -0,0 +1,87 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import FavoriteRecipe, Follow, ShoppingList
+
+VERSION_KEY = 'relations:{user_id}:version'
+RELATIONS_KEY = 'relations:{user_id}:{version}:{kind}'
+
+SOURCES = {
+    'favorites': (FavoriteRecipe, 'recipe_id'),
+    'cart': (ShoppingList, 'recipe_id'),
+    'following': (Follow, 'author_id'),
+}
+
+
+def bump_relations_version(user_id):
+    """Сбрасывает закэшированные связи пользователя."""
+    cache.set(VERSION_KEY.format(user_id=user_id), uuid.uuid4().hex, None)
+
+
+class UserRelations:
+    """Избранное, список покупок и подписки текущего пользователя.
+
+    Каждое множество загружается при первом обращении одним запросом.
+    Если задан USER_RELATIONS_CACHE_TIMEOUT, множества живут и в общем
+    кэше под версией пользователя, которую меняют записи в эти таблицы.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._loaded = {}
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self._get('favorites')
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self._get('cart')
+
+    def is_subscribed(self, author_id):
+        return author_id in self._get('following')
+
+    def load(self, kind):
+        """Загружает одно из множеств заранее, например в отдельном потоке."""
+        self._get(kind)
+
+    def _get(self, kind):
+        if self.user.is_anonymous:
+            return frozenset()
+        if kind not in self._loaded:
+            self._loaded[kind] = self._load(kind)
+        return self._loaded[kind]
+
+    def _load(self, kind):
+        model, field = SOURCES[kind]
+        timeout = settings.USER_RELATIONS_CACHE_TIMEOUT
+        # Внутри транзакции записи кэш мог еще не узнать о ней.
+        if not timeout or connection.in_atomic_block:
+            return frozenset(model.objects.filter(
+                user=self.user
+            ).values_list(field, flat=True))
+        version = cache.get_or_set(
+            VERSION_KEY.format(user_id=self.user.id), uuid.uuid4().hex, None
+        )
+        key = RELATIONS_KEY.format(
+            user_id=self.user.id, version=version, kind=kind
+        )
+        ids = cache.get(key)
+        if ids is None:
+            ids = frozenset(model.objects.filter(
+                user=self.user
+            ).values_list(field, flat=True))
+            cache.set(key, ids, timeout)
+        return ids
+
+
+def get_user_relations(request):
+    """Связи пользователя, общие для всех сериализаторов запроса."""
+    user = request.user
+    request = getattr(request, '_request', request)
+    relations = getattr(request, 'user_relations', None)
+    if relations is None or relations.user != user:
+        relations = UserRelations(user)
+        request.user_relations = relations
+    return relations
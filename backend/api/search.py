@@ -0,0 +1,106 @@
+import re
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .autocomplete import normalize
+from .models import Recipe
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'api_recipe_fts'
+
+
+@lru_cache(maxsize=None)
+def fts_available():
+    """Есть ли в SQLite таблица полнотекстового индекса рецептов."""
+    return (
+        connection.vendor == 'sqlite'
+        and FTS_TABLE in connection.introspection.table_names()
+    )
+
+
+def fts_query(query):
+    """Запрос FTS5 из слов пользователя, каждое слово — префикс."""
+    words = re.findall(r'\w+', normalize(query))
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, query):
+    """Фильтрует рецепты по тексту и сортирует по релевантности."""
+    table = queryset.model._meta.db_table
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        return queryset.annotate(
+            search_match=RawSQL(
+                f'"{table}"."search_vector" @@ {tsquery}',
+                (query,), output_field=BooleanField(),
+            ),
+            search_rank=RawSQL(
+                f'ts_rank("{table}"."search_vector", {tsquery})',
+                (query,), output_field=FloatField(),
+            ),
+        ).filter(search_match=True).order_by('-search_rank', '-pub_date')
+    if fts_available():
+        match = fts_query(query)
+        if not match:
+            return queryset.none()
+        # Совпадения выбираются по индексу один раз, bm25 считается
+        # только для найденных строк. Меньше — лучше, название весит
+        # больше текста.
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )).annotate(search_rank=RawSQL(
+            f'SELECT bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            (match,), output_field=FloatField(),
+        )).order_by('search_rank', '-pub_date')
+    return queryset.filter(Q(name__icontains=query) | Q(text__icontains=query))
+
+
+def index_recipe(recipe):
+    """Обновляет запись рецепта в индексе SQLite.
+
+    В PostgreSQL вектор поиска — вычисляемая колонка, поддерживать ее
+    не нужно.
+    """
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', (recipe.pk,)
+        )
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            'VALUES (%s, %s, %s)',
+            (recipe.pk, normalize(recipe.name), normalize(recipe.text)),
+        )
+
+
+def unindex_recipe(recipe_id):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', (recipe_id,)
+        )
+
+
+def reindex_recipes():
+    """Перестраивает индекс SQLite по всем рецептам."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            'VALUES (%s, %s, %s)',
+            [
+                (pk, normalize(name), normalize(text))
+                for pk, name, text in Recipe.objects.values_list(
+                    'pk', 'name', 'text'
+                )
+            ],
+        )
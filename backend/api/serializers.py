@@ -1,15 +1,46 @@
+from collections import Counter
+
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from .models import (Follow, Ingredient, NumberIngredient,
+from .bulk import MAX_IDS
+from .images import rendition_name, renditions_ready
+from .models import (Ingredient, NumberIngredient,
                      Recipe, Tag)
+from .relations import get_user_relations
 
 User = get_user_model()
 
 
+class RecipeImageField(Base64ImageField):
+    """Картинка рецепта: принимает base64, отдает ссылку на нужный размер."""
+
+    def __init__(self, *args, rendition=None, webp=False, **kwargs):
+        self.rendition = rendition
+        self.webp = webp
+        super().__init__(*args, **kwargs)
+
+    def to_representation(self, file):
+        if not file:
+            return None
+        name = file.name
+        rendition = self.context.get('image_rendition', self.rendition)
+        if rendition is not None:
+            if renditions_ready(file):
+                name = rendition_name(file.name, rendition, self.webp)
+            elif self.webp:
+                return None
+        url = file.storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
 class UserSerializer(serializers.ModelSerializer):
     """ Сериализатор для модели User."""
 
@@ -33,11 +64,9 @@ class UserSerializer(serializers.ModelSerializer):
         """Подписка пользователя."""
 
         request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
+        if request is None:
             return False
-        return Follow.objects.filter(
-            user=request.user,
-            author=obj.id).exists()
+        return get_user_relations(request).is_subscribed(obj.id)
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -50,7 +79,7 @@ class FollowSerializer(serializers.ModelSerializer):
     last_name = serializers.ReadOnlyField(source='author.last_name')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = User
@@ -58,11 +87,18 @@ class FollowSerializer(serializers.ModelSerializer):
                   'is_subscribed', 'recipes', 'recipes_count')
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=obj.user, author=obj.author
-        ).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        request = self.context.get('request')
+        if request is None:
+            return False
+        return get_user_relations(request).is_subscribed(obj.author_id)
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'recipes_preview'):
+            return SummuryRecipeSerializer(
+                obj.recipes_preview, many=True
+            ).data
         request = self.context.get('request')
         limit = request.GET.get('recipes_limit')
         queryset = Recipe.objects.filter(author=obj.author)
@@ -70,21 +106,34 @@ class FollowSerializer(serializers.ModelSerializer):
             queryset = queryset[:int(limit)]
         return SummuryRecipeSerializer(queryset, many=True).data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
-
 
 class SummuryRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для краткого описания рецепта."""
-    
-    image = Base64ImageField()
+
+    image = RecipeImageField(rendition='thumb')
+    image_webp = RecipeImageField(
+        source='image', rendition='thumb', webp=True, read_only=True
+    )
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_webp', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для массового добавления или удаления."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_IDS,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Tag."""
 
@@ -126,7 +175,10 @@ class IngredientsAmountSerializer(serializers.ModelSerializer):
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = RecipeImageField(rendition='card')
+    image_webp = RecipeImageField(
+        source='image', rendition='card', webp=True, read_only=True
+    )
     tags = TagSerializer(read_only=True, many=True)
     author = UserSerializer(read_only=True)
     ingredients = IngredientsAmountSerializer(
@@ -140,43 +192,105 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_webp',
+                  'text', 'cooking_time')
+
+    def get_fields(self):
+        """Только поля из context['fields'], если они заданы."""
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        if selected is None:
+            return fields
+        return {
+            name: field for name, field in fields.items()
+            if name in selected
+        }
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
+        request = self.context.get('request')
+        if request is None:
             return False
-        return Recipe.objects.filter(favoriterecipe__user=user, id=obj.id).exists()
+        return get_user_relations(request).is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
+        request = self.context.get('request')
+        if request is None:
             return False
-        return Recipe.objects.filter(shoppinglist__user=user, id=obj.id).exists()
+        return get_user_relations(request).is_in_shopping_cart(obj.id)
 
     def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
-        if not ingredients:
-            raise serializers.ValidationError({
-                'ingredients': 'Нужен хоть один ингридиент для рецепта'})
-        ingredient_list = []
-        for ingredient_item in ingredients:
-            ingredient = get_object_or_404(Ingredient,
-                                           id=ingredient_item['id'])
-            if ingredient in ingredient_list:
-                raise serializers.ValidationError('Ингридиенты должны '
-                                                  'быть уникальными')
-            ingredient_list.append(ingredient)
-            if int(ingredient_item['amount']) < 0:
-                raise serializers.ValidationError({
-                    'ingredients': ('Убедитесь, что значение количества '
-                                    'ингредиента больше 0')
-                })
+        errors = {}
+        ingredients = self.validate_ingredient_items(
+            self.initial_data.get('ingredients'), errors
+        )
+        tags = self.validate_tag_items(self.initial_data.get('tags'), errors)
+        if errors:
+            raise serializers.ValidationError(errors)
         data['ingredients'] = ingredients
+        data['tags'] = tags
         return data
 
+    def validate_ingredient_items(self, items, errors):
+        """Проверяет ингредиенты одним запросом, собирая все ошибки."""
+        if not items:
+            errors['ingredients'] = ['Нужен хоть один ингридиент для рецепта']
+            return None
+        try:
+            amounts = [
+                (int(item['id']), int(item['amount'])) for item in items
+            ]
+        except (KeyError, TypeError, ValueError):
+            errors['ingredients'] = [
+                'Каждый ингредиент должен содержать числовые id и amount'
+            ]
+            return None
+        ids = Counter(ingredient_id for ingredient_id, _ in amounts)
+        found = Ingredient.objects.in_bulk(list(ids))
+        messages = []
+        missing = sorted(ids.keys() - found.keys())
+        if missing:
+            messages.append(f'Ингредиенты не найдены: {missing}')
+        duplicates = sorted(
+            ingredient_id for ingredient_id, count in ids.items() if count > 1
+        )
+        if duplicates:
+            messages.append(
+                f'Ингридиенты должны быть уникальными: {duplicates}'
+            )
+        too_small = sorted({
+            ingredient_id for ingredient_id, amount in amounts if amount < 1
+        })
+        if too_small:
+            messages.append('Убедитесь, что значение количества ингредиента '
+                            f'больше 0: {too_small}')
+        if messages:
+            errors['ingredients'] = messages
+            return None
+        return [
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id, amount in amounts
+        ]
+
+    def validate_tag_items(self, items, errors):
+        """Проверяет теги одним запросом."""
+        if not items:
+            errors['tags'] = ['Нужен хоть один тег для рецепта']
+            return None
+        try:
+            ids = {int(tag_id) for tag_id in items}
+        except (TypeError, ValueError):
+            errors['tags'] = ['Теги передаются списком id']
+            return None
+        found = Tag.objects.in_bulk(ids)
+        missing = sorted(ids - found.keys())
+        if missing:
+            errors['tags'] = [f'Теги не найдены: {missing}']
+            return None
+        return list(found.values())
+
     def create_ingredients(self, ingredients, recipe):
+        if not ingredients:
+            return
         NumberIngredient.objects.bulk_create(
             [NumberIngredient(
                 ingredient_id=ingredient.get('id'),
@@ -185,15 +299,17 @@ class RecipeSerializer(serializers.ModelSerializer):
             ) for ingredient in ingredients]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         image = validated_data.pop('image')
         ingredients_data = validated_data.pop('ingredients')
+        tags_data = validated_data.pop('tags')
         recipe = Recipe.objects.create(image=image, **validated_data)
-        tags_data = self.initial_data.get('tags')
         recipe.tags.set(tags_data)
         self.create_ingredients(ingredients_data, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.image = validated_data.get('image', instance.image)
         instance.name = validated_data.get('name', instance.name)
@@ -201,10 +317,32 @@ class RecipeSerializer(serializers.ModelSerializer):
         instance.cooking_time = validated_data.get(
             'cooking_time', instance.cooking_time
         )
-        instance.tags.clear()
-        tags_data = self.initial_data.get('tags')
-        instance.tags.set(tags_data)
-        NumberIngredient.objects.filter(recipe=instance).all().delete()
-        self.create_ingredients(validated_data.get('ingredients'), instance)
-        instance.save()
+        # set() без clear сам удаляет лишние и добавляет новые связи.
+        instance.tags.set(validated_data.get('tags'))
+        self.update_ingredients(validated_data.get('ingredients'), instance)
+        instance.save(update_fields=('image', 'name', 'text', 'cooking_time'))
         return instance
+
+    def update_ingredients(self, ingredients, recipe):
+        """Применяет к ингредиентам рецепта только разницу с текущими."""
+        current = {
+            item.ingredient_id: item
+            for item in NumberIngredient.objects.filter(recipe=recipe)
+        }
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        removed = current.keys() - amounts.keys()
+        if removed:
+            NumberIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        self.create_ingredients([
+            item for item in ingredients if item['id'] not in current
+        ], recipe)
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            item = current.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            NumberIngredient.objects.bulk_update(changed, ('amount',))
@@ -0,0 +1,219 @@
+import csv
+import io
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .models import NumberIngredient
+
+FONT_NAME = 'Slimamif'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'Slimamif.ttf')
+PAGE_TOP = 800
+PAGE_BOTTOM = 50
+LINE_HEIGHT = 25
+
+VERSION_KEY = 'shopping_cart:version:{user_id}'
+EXPORT_KEY = 'shopping_cart:export:{user_id}:{version}:{file_type}'
+JOB_KEY = 'shopping_cart:job:{job_id}'
+EXPORT_TIMEOUT = settings.SHOPPING_CART_EXPORT_TIMEOUT
+JOB_STALE = settings.SHOPPING_CART_EXPORT_STALE
+
+JOB_PENDING = 'pending'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """Регистрирует шрифт один раз на процесс."""
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH, 'UTF-8'))
+
+
+def get_shopping_cart_ingredients(user):
+    """Суммарное количество ингредиентов из списка покупок."""
+    return NumberIngredient.objects.filter(
+        recipe__shoppinglist__user=user
+    ).values(
+        'ingredient__name', 'ingredient__measure'
+    ).annotate(
+        amount=Sum('amount')
+    ).order_by('ingredient__name', 'ingredient__measure')
+
+
+def render_pdf(ingredients, stream):
+    """Рисует список покупок в PDF, переходя на новые страницы."""
+    register_font()
+    page = canvas.Canvas(stream)
+    page.setFont(FONT_NAME, size=24)
+    page.drawString(200, PAGE_TOP, 'Список ингредиентов')
+    page.setFont(FONT_NAME, size=16)
+    height = PAGE_TOP - 50
+    for i, item in enumerate(ingredients, 1):
+        if height < PAGE_BOTTOM:
+            page.showPage()
+            page.setFont(FONT_NAME, size=16)
+            height = PAGE_TOP
+        page.drawString(75, height, (
+            f'<{i}> {item["ingredient__name"]} - {item["amount"]}, '
+            f'{item["ingredient__measure"]}'
+        ))
+        height -= LINE_HEIGHT
+    page.showPage()
+    page.save()
+    return stream
+
+
+def render_csv(ingredients, stream):
+    """Список покупок в CSV."""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for item in ingredients:
+        writer.writerow((item['ingredient__name'], item['amount'],
+                         item['ingredient__measure']))
+    text.detach()
+    return stream
+
+
+def render_txt(ingredients, stream):
+    """Список покупок обычным текстом."""
+    lines = ['Список ингредиентов', '']
+    lines.extend(
+        f'{i}. {item["ingredient__name"]} - {item["amount"]}, '
+        f'{item["ingredient__measure"]}'
+        for i, item in enumerate(ingredients, 1)
+    )
+    stream.write('\n'.join(lines).encode('utf-8'))
+    return stream
+
+
+EXPORT_FORMATS = {
+    'pdf': ('application/pdf', render_pdf),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'txt': ('text/plain; charset=utf-8', render_txt),
+}
+
+
+def get_cart_version(user_id):
+    """Текущая версия списка покупок пользователя."""
+    return cache.get_or_set(
+        VERSION_KEY.format(user_id=user_id), uuid.uuid4().hex, None
+    )
+
+
+def bump_cart_version(*user_ids):
+    """Меняет версию списка покупок, делая старые выгрузки недоступными."""
+    cache.set_many({
+        VERSION_KEY.format(user_id=user_id): uuid.uuid4().hex
+        for user_id in user_ids
+    }, None)
+
+
+def get_etag(user_id, version, file_type):
+    return f'"{user_id}-{version}-{file_type}"'
+
+
+def get_cached_export(user_id, version, file_type):
+    return cache.get(EXPORT_KEY.format(
+        user_id=user_id, version=version, file_type=file_type
+    ))
+
+
+def build_export(user, version, file_type):
+    """Строит выгрузку и кладет ее в кэш под версией списка покупок."""
+    _, render = EXPORT_FORMATS[file_type]
+    content = render(
+        get_shopping_cart_ingredients(user), io.BytesIO()
+    ).getvalue()
+    cache.set(EXPORT_KEY.format(
+        user_id=user.id, version=version, file_type=file_type
+    ), content, EXPORT_TIMEOUT)
+    return content
+
+
+def get_export(user, version, file_type):
+    """Возвращает выгрузку нужной версии, используя кэш."""
+    content = get_cached_export(user.id, version, file_type)
+    if content is None:
+        content = build_export(user, version, file_type)
+    return content
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.SHOPPING_CART_EXPORT_WORKERS,
+        thread_name_prefix='shopping-cart-export',
+    )
+
+
+def start_export_job(user, file_type):
+    """Запускает построение выгрузки вне потока запроса.
+
+    Задачи хранятся в кэше, поэтому при нескольких процессах он должен
+    быть общим, иначе статус спросят у процесса, который о задаче
+    не знает.
+    """
+    job_id = uuid.uuid4().hex
+    version = get_cart_version(user.id)
+    ready = get_cached_export(user.id, version, file_type) is not None
+    job = {
+        'id': job_id,
+        'user': user.id,
+        'type': file_type,
+        'version': version,
+        'status': JOB_DONE if ready else JOB_PENDING,
+    }
+    if ready:
+        cache.set(JOB_KEY.format(job_id=job_id), job, EXPORT_TIMEOUT)
+    else:
+        submit_export_job(user, job)
+    return job
+
+
+def submit_export_job(user, job):
+    job['started'] = time.time()
+    cache.set(JOB_KEY.format(job_id=job['id']), job, EXPORT_TIMEOUT)
+    get_executor().submit(_run_export_job, user, job)
+
+
+def _run_export_job(user, job):
+    try:
+        build_export(user, job['version'], job['type'])
+        job['status'] = JOB_DONE
+    except Exception:
+        job['status'] = JOB_FAILED
+        raise
+    finally:
+        cache.set(JOB_KEY.format(job_id=job['id']), job, EXPORT_TIMEOUT)
+        connection.close()
+
+
+def get_export_job(job_id, user):
+    """Задача пользователя или None.
+
+    Очередь у каждого процесса своя и пропадает при его перезапуске,
+    поэтому задачу, которая слишком долго ждет, запускает заново тот
+    процесс, у которого спросили статус.
+    """
+    job = cache.get(JOB_KEY.format(job_id=job_id))
+    if job is None or job['user'] != user.id:
+        return None
+    if (job['status'] == JOB_PENDING
+            and time.time() - job['started'] > JOB_STALE):
+        if get_cached_export(user.id, job['version'], job['type']) is None:
+            submit_export_job(user, job)
+        else:
+            job['status'] = JOB_DONE
+            cache.set(JOB_KEY.format(job_id=job_id), job, EXPORT_TIMEOUT)
+    return job
@@ -0,0 +1,192 @@
+import logging
+
+from django.db import transaction
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .autocomplete import ingredient_index
+from .catalogs import invalidate_catalog
+from .cookbook import mark_recipe_changed
+from .counters import COUNTERS, change_counter
+from .images import make_renditions, run_in_background
+from .models import (FavoriteRecipe, Follow, Ingredient, NumberIngredient,
+                     Recipe, ShoppingList, Tag)
+from .public_cache import AUTHOR_FIELDS, bump_public_version
+from .relations import bump_relations_version
+from .search import index_recipe, unindex_recipe
+from .shopping_cart import bump_cart_version
+from .timeline import backfill, drop_authors, fan_out
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=ShoppingList)
+def shopping_list_changed(sender, instance, **kwargs):
+    """Новая версия списка покупок при добавлении или удалении рецепта."""
+    transaction.on_commit(lambda: bump_cart_version(instance.user_id))
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+@receiver((post_save, post_delete), sender=ShoppingList)
+@receiver((post_save, post_delete), sender=Follow)
+def relation_changed(sender, instance, **kwargs):
+    """Сброс закэшированных связей пользователя."""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: bump_relations_version(user_id))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, created, **kwargs):
+    """Новая версия списков покупок, в которых лежит измененный рецепт."""
+    if created:
+        return
+    user_ids = list(ShoppingList.objects.filter(
+        recipe=instance
+    ).values_list('user_id', flat=True))
+    transaction.on_commit(lambda: bump_cart_version(*user_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    """Уменьшенные копии новой картинки рецепта, в фоне после коммита."""
+    pk, name = instance.pk, instance.image.name
+    if not name or instance.rendered_image == name:
+        return
+    transaction.on_commit(
+        lambda: run_in_background(render_recipe_image, pk, name)
+    )
+
+
+def render_recipe_image(pk, name):
+    """Создает копии и отмечает их, если картинку еще не заменили."""
+    try:
+        make_renditions(Recipe(image=name).image)
+    except (OSError, ValueError):
+        logger.exception('Не удалось обработать картинку %s', name)
+        return
+    if Recipe.objects.filter(pk=pk, image=name).update(rendered_image=name):
+        bump_public_version()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_saved(sender, instance, **kwargs):
+    """Запись рецепта в полнотекстовом индексе."""
+    index_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_search_deleted(sender, instance, **kwargs):
+    unindex_recipe(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    """Обновление индекса «что приготовить».
+
+    Состав рецепта в сериализаторе меняется массовыми запросами без
+    сигналов, поэтому отмечаем рецепт при каждом его сохранении.
+    """
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: mark_recipe_changed(recipe_id))
+
+
+@receiver((post_save, post_delete), sender=NumberIngredient)
+def number_ingredient_changed(sender, instance, **kwargs):
+    recipe_id = instance.recipe_id
+    transaction.on_commit(lambda: mark_recipe_changed(recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    """Новый рецепт попадает в ленты подписчиков автора."""
+    if created:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        backfill(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    drop_authors(instance.user_id, [instance.author_id])
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    """Сброс каталога и индекса поиска ингредиентов."""
+    transaction.on_commit(ingredient_index.invalidate)
+    transaction.on_commit(lambda: invalidate_catalog('ingredients'))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    """Сброс каталога тегов."""
+    transaction.on_commit(lambda: invalidate_catalog('tags'))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=NumberIngredient)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def public_recipes_changed(sender, **kwargs):
+    """Сброс кэша страниц рецептов для анонимных пользователей."""
+    transaction.on_commit(bump_public_version)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        transaction.on_commit(bump_public_version)
+
+
+@receiver(pre_save, sender=User)
+def author_saving(sender, instance, update_fields=None, **kwargs):
+    """Отмечает, меняются ли данные автора, которые выводятся в рецептах.
+
+    Удаление автора удаляет и его рецепты, их сигналы сбрасывают кэш.
+    """
+    fields = set(AUTHOR_FIELDS)
+    if update_fields is not None:
+        fields &= set(update_fields)
+    instance.author_changed = False
+    if instance.pk is None or not fields:
+        return
+    old = User.objects.filter(pk=instance.pk).values(*fields).first()
+    instance.author_changed = old is not None and any(
+        old[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, **kwargs):
+    """Данные автора входят в карточку рецепта."""
+    if instance.author_changed:
+        transaction.on_commit(bump_public_version)
+
+
+def connect_counter(source, relation, target, field):
+    """Поддерживает счетчик в той же транзакции, что и запись источника."""
+
+    attname = f'{relation}_id'
+
+    def increment(sender, instance, created, **kwargs):
+        if created:
+            change_counter(target, field, getattr(instance, attname), 1)
+
+    def decrement(sender, instance, **kwargs):
+        change_counter(target, field, getattr(instance, attname), -1)
+
+    uid = f'{source.__name__}.{field}'
+    post_save.connect(increment, sender=source, weak=False, dispatch_uid=uid)
+    post_delete.connect(decrement, sender=source, weak=False, dispatch_uid=uid)
+
+
+for counter in COUNTERS:
+    connect_counter(*counter)
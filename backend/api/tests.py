@@ -0,0 +1,1087 @@
+import base64
+import io
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.test import (
+    AsyncClient, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from . import async_views, public_cache, relations, shopping_cart, urls
+from .cookbook import (
+    CHANGE_KEY, VERSION_KEY, RecipeIngredientIndex, Snapshot,
+)
+from .metrics import install_query_wrappers
+from .models import (
+    FavoriteRecipe, Follow, Ingredient, NumberIngredient, Recipe,
+    ShoppingList, Tag, TimelineEntry,
+)
+from .search import fts_available
+from .shopping_cart import JOB_KEY
+from .views import RecipeViewSet
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# Адреса как при ASGI_MODE: api.urls читает настройку при импорте.
+urlpatterns = [
+    path('api/', include(async_views.urlpatterns + urls.urlpatterns)),
+    path('api/', include('users.urls')),
+]
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def make_image(color='#c06030'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name='image.png')
+
+
+def create_data(data):
+    """Пользователи, теги, ингредиенты и рецепты как атрибуты data.
+
+    Рецепт number принадлежит пользователю number % 2, у нечетных
+    два тега, у number — первые 1 + number % 4 ингредиента
+    в количестве number + 1.
+    """
+    data.users = [
+        User.objects.create_user(
+            username=f'user{number}',
+            email=f'user{number}@foodgram.ru',
+            password='password-123',
+            first_name='Повар',
+            last_name=str(number),
+        )
+        for number in range(2)
+    ]
+    data.tags = [
+        Tag.objects.create(name=name, color=color, slug=slug)
+        for name, color, slug in (
+            ('Завтрак', '#E26C2D', 'breakfast'),
+            ('Обед', '#49B64E', 'lunch'),
+            ('Ужин', '#8775D2', 'dinner'),
+        )
+    ]
+    data.ingredients = [
+        Ingredient.objects.create(name=f'ингредиент {number}', measure='г')
+        for number in range(4)
+    ]
+    data.recipes = []
+    for number in range(6):
+        recipe = Recipe.objects.create(
+            author=data.users[number % 2],
+            name=f'Рецепт {number}',
+            text='Описание',
+            cooking_time=10,
+            image=make_image(),
+        )
+        recipe.tags.set(data.tags[:1 + number % 2])
+        NumberIngredient.objects.bulk_create(
+            NumberIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=number + 1)
+            for ingredient in data.ingredients[:1 + number % 4]
+        )
+        data.recipes.append(recipe)
+    FavoriteRecipe.objects.create(user=data.users[0], recipe=data.recipes[0])
+
+
+def make_clients(data):
+    cache.clear()
+    data.anonymous = APIClient()
+    data.client = APIClient()
+    data.client.force_authenticate(data.users[0])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPES_CACHE_TIMEOUT=0,
+                   RECIPE_IMAGE_WORKERS=0)
+class RecipeTestCase(TestCase):
+    """Пользователи, теги и рецепты с картинками и ингредиентами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_data(cls)
+
+    def setUp(self):
+        make_clients(self)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPES_CACHE_TIMEOUT=0,
+                   RECIPE_IMAGE_WORKERS=0)
+class RecipeTransactionTestCase(TransactionTestCase):
+    """Те же данные для проверок с другими потоками и on_commit."""
+
+    def setUp(self):
+        create_data(self)
+        make_clients(self)
+
+
+class RecipeQueryCountTest(RecipeTestCase):
+    """Число запросов не зависит от размера страницы."""
+
+    def assert_queries(self, client, url, count):
+        with self.assertNumQueries(count):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list(self):
+        # COUNT, страница с авторами, теги.
+        for limit in (2, 6):
+            with self.subTest(limit=limit):
+                response = self.assert_queries(
+                    self.anonymous, f'/api/recipes/?limit={limit}', 3
+                )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_authenticated(self):
+        # Плюс избранное, список покупок и подписки пользователя.
+        for limit in (2, 6):
+            with self.subTest(limit=limit):
+                response = self.assert_queries(
+                    self.client, f'/api/recipes/?limit={limit}', 6
+                )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_detail(self):
+        # Рецепт с автором, теги, ингредиенты.
+        for recipe in self.recipes[:2]:
+            with self.subTest(recipe=recipe.pk):
+                self.assert_queries(
+                    self.anonymous, f'/api/recipes/{recipe.pk}/', 3
+                )
+
+    def test_detail_authenticated(self):
+        for recipe in self.recipes[:2]:
+            with self.subTest(recipe=recipe.pk):
+                response = self.assert_queries(
+                    self.client, f'/api/recipes/{recipe.pk}/', 6
+                )
+                self.assertEqual(
+                    response.data['is_favorited'], recipe == self.recipes[0]
+                )
+
+    def test_subscriptions(self):
+        # COUNT, страница с авторами, рецепты авторов; подписки
+        # пользователя не загружаются.
+        Follow.objects.create(user=self.users[0], author=self.users[1])
+        response = self.assert_queries(
+            self.client, '/api/users/subscriptions/?limit=6', 3
+        )
+        self.assertTrue(response.data['results'][0]['is_subscribed'])
+
+
+class RecipeTagFilterTest(RecipeTestCase):
+    """Фильтр по нескольким тегам не дублирует рецепты."""
+
+    def get_ids(self, query):
+        response = self.anonymous.get(f'/api/recipes/?limit=100&{query}')
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(response.data['count'], len(ids))
+        return ids
+
+    def test_several_tags(self):
+        ids = self.get_ids('tags=breakfast&tags=lunch')
+        self.assertCountEqual(ids, [recipe.pk for recipe in self.recipes])
+
+    def test_one_tag(self):
+        ids = self.get_ids('tags=lunch')
+        self.assertCountEqual(
+            ids, [recipe.pk for recipe in self.recipes[1::2]]
+        )
+
+    def test_unknown_tag(self):
+        self.assertEqual(self.get_ids('tags=unknown'), [])
+        self.assertEqual(self.get_ids('tags=dinner'), [])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPES_CACHE_TIMEOUT=0,
+                   RECIPE_IMAGE_WORKERS=0)
+class ConcurrentLinkTest(TransactionTestCase):
+    """Одновременные запросы на одну пару: ровно один меняет данные."""
+
+    THREADS = 12
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Общий кэш SQLite в памяти не ждет снятия блокировок.
+            self.skipTest('нужна база в файле: задайте DB_TEST_NAME')
+        cache.clear()
+        self.user, self.author = (
+            User.objects.create_user(
+                username=username, email=f'{username}@foodgram.ru',
+                password='password-123', first_name='Повар',
+                last_name=username,
+            )
+            for username in ('user', 'author')
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10, image=make_image(),
+        )
+
+    def hammer(self, method, url):
+        """Шлет запрос из всех потоков сразу и считает коды ответов."""
+        barrier = threading.Barrier(self.THREADS)
+        codes = Counter()
+        lock = threading.Lock()
+
+        def run():
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                code = getattr(client, method)(url).status_code
+                with lock:
+                    codes[code] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return codes
+
+    def assert_race(self, url, model, lookup, counter, absent=400):
+        for method, winner, rows in (
+            ('post', 201, 1),
+            ('delete', 204, 0),
+        ):
+            with self.subTest(method=method):
+                codes = self.hammer(method, url)
+                loser = 400 if method == 'post' else absent
+                self.assertEqual(
+                    codes, {winner: 1, loser: self.THREADS - 1}
+                )
+                self.assertEqual(model.objects.filter(**lookup).count(), rows)
+                self.assertEqual(counter(), rows)
+
+    def test_favorite(self):
+        self.assert_race(
+            f'/api/recipes/{self.recipe.pk}/favorite/', FavoriteRecipe,
+            {'user': self.user, 'recipe': self.recipe},
+            lambda: Recipe.objects.get(pk=self.recipe.pk).favorites_count,
+        )
+
+    def test_shopping_cart(self):
+        self.assert_race(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/', ShoppingList,
+            {'user': self.user, 'recipe': self.recipe},
+            lambda: Recipe.objects.get(
+                pk=self.recipe.pk
+            ).shopping_cart_count,
+        )
+
+    def test_subscribe(self):
+        self.assert_race(
+            f'/api/users/{self.author.pk}/subscribe/', Follow,
+            {'user': self.user, 'author': self.author},
+            lambda: User.objects.get(pk=self.author.pk).followers_count,
+            absent=404,
+        )
+
+
+class ShoppingCartExportTest(RecipeTestCase):
+    """Выгрузка списка покупок в разных форматах."""
+
+    URL = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        for recipe in self.recipes[:2]:
+            ShoppingList.objects.create(user=self.users[0], recipe=recipe)
+
+    def test_csv(self):
+        response = self.client.get(f'{self.URL}?type=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            response.content.decode().splitlines(),
+            ['Ингредиент,Количество,Единица измерения',
+             'ингредиент 0,3,г', 'ингредиент 1,2,г'],
+        )
+
+    def test_txt(self):
+        response = self.client.get(f'{self.URL}?type=txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.content.decode().splitlines(),
+            ['Список ингредиентов', '',
+             '1. ингредиент 0 - 3, г', '2. ингредиент 1 - 2, г'],
+        )
+
+    def test_pdf_by_default(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+    def test_unknown_type(self):
+        self.assertEqual(
+            self.client.get(f'{self.URL}?type=xls').status_code, 400
+        )
+
+    def test_not_modified_until_cart_changes(self):
+        etag = self.client.get(f'{self.URL}?type=txt')['ETag']
+        response = self.client.get(
+            f'{self.URL}?type=txt', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                f'/api/recipes/{self.recipes[2].pk}/shopping_cart/'
+            )
+        response = self.client.get(
+            f'{self.URL}?type=txt', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ингредиент 2 - 3, г', response.content.decode())
+
+    def test_anonymous(self):
+        self.assertEqual(self.anonymous.get(self.URL).status_code, 401)
+
+
+class ShoppingCartJobTest(RecipeTransactionTestCase):
+    """Фоновая выгрузка: статус и скачивание готового файла."""
+
+    URL = '/api/recipes/download_shopping_cart/jobs/'
+
+    def setUp(self):
+        super().setUp()
+        ShoppingList.objects.create(
+            user=self.users[0], recipe=self.recipes[1]
+        )
+
+    def wait_done(self, job_id):
+        for _ in range(100):
+            job = self.client.get(f'{self.URL}{job_id}/').data
+            if job['status'] != 'pending':
+                return job
+            time.sleep(0.05)
+        self.fail('Выгрузка не завершилась')
+
+    def test_job(self):
+        response = self.client.post(self.URL, {'type': 'txt'})
+        self.assertEqual(response.status_code, 202)
+        job = self.wait_done(response.data['id'])
+        self.assertEqual(job['status'], 'done')
+        response = self.client.get(f'{self.URL}{job["id"]}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.content,
+            self.client.get(
+                '/api/recipes/download_shopping_cart/?type=txt'
+            ).content,
+        )
+        # Готовая выгрузка той же версии не строится заново.
+        response = self.client.post(self.URL, {'type': 'txt'})
+        self.assertEqual(response.data['status'], 'done')
+
+    def test_other_user(self):
+        job_id = self.client.post(self.URL).data['id']
+        other = APIClient()
+        other.force_authenticate(self.users[1])
+        self.assertEqual(other.get(f'{self.URL}{job_id}/').status_code, 404)
+        self.assertEqual(
+            other.get(f'{self.URL}{job_id}/download/').status_code, 404
+        )
+        self.wait_done(job_id)
+
+    def test_unknown_type(self):
+        self.assertEqual(
+            self.client.post(self.URL, {'type': 'xls'}).status_code, 400
+        )
+
+    def test_lost_job_restarts(self):
+        # Процесс, который принял задачу, перезапустился до ее запуска.
+        with mock.patch('api.shopping_cart.get_executor') as executor:
+            job_id = self.client.post(self.URL).data['id']
+        executor.return_value.submit.assert_called_once()
+        self.assertEqual(
+            self.client.get(f'{self.URL}{job_id}/download/').status_code,
+            409,
+        )
+        key = JOB_KEY.format(job_id=job_id)
+        job = cache.get(key)
+        job['started'] -= settings.SHOPPING_CART_EXPORT_STALE + 1
+        cache.set(key, job)
+        self.assertEqual(self.wait_done(job_id)['status'], 'done')
+        self.assertEqual(
+            self.client.get(f'{self.URL}{job_id}/download/').status_code,
+            200,
+        )
+
+
+class KeysetPaginationTest(RecipeTestCase):
+    """Курсорная пагинация по (pub_date, id) и по id подписки."""
+
+    def setUp(self):
+        super().setUp()
+        # Одинаковые даты проверяют второй ключ сортировки.
+        pub_date = timezone.now()
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in self.recipes[1:4]]
+        ).update(pub_date=pub_date)
+        self.expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', flat=True))
+
+    def walk(self, url, link='next'):
+        ids = []
+        pages = []
+        while url:
+            response = self.anonymous.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            url = response.data[link]
+        for page in (pages if link == 'next' else reversed(pages)):
+            ids.extend(page)
+        return ids, response.data
+
+    def test_next_links(self):
+        ids, last = self.walk('/api/recipes/?cursor=&limit=2')
+        self.assertEqual(ids, self.expected)
+        self.assertNotIn('count', last)
+
+    def test_previous_links(self):
+        *_, last = self.walk('/api/recipes/?cursor=&limit=4')
+        ids, first = self.walk(last['previous'], link='previous')
+        self.assertEqual(ids, self.expected[:4])
+        self.assertIsNone(first['previous'])
+
+    def test_stable_under_inserts(self):
+        response = self.anonymous.get('/api/recipes/?cursor=&limit=3')
+        Recipe.objects.create(
+            author=self.users[0], name='Новый', text='Описание',
+            cooking_time=5, image=make_image(),
+        )
+        next_page = self.anonymous.get(response.data['next'])
+        self.assertEqual(
+            [item['id'] for item in next_page.data['results']],
+            self.expected[3:],
+        )
+
+    def test_first_key_bound(self):
+        response = self.anonymous.get('/api/recipes/?cursor=&limit=2')
+        with CaptureQueriesContext(connection) as queries:
+            self.anonymous.get(response.data['next'])
+        sql = queries.captured_queries[0]['sql']
+        self.assertIn('"api_recipe"."pub_date" <=', sql)
+        self.assertIn('"api_recipe"."pub_date" <', sql.replace('<=', ''))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(
+            self.anonymous.get('/api/recipes/?cursor=bad').status_code, 404
+        )
+
+    def test_subscriptions(self):
+        author = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            password='password-123', first_name='Автор', last_name='Автор',
+        )
+        authors = [self.users[1], author]
+        for user in authors:
+            Follow.objects.create(user=self.users[0], author=user)
+        response = self.client.get('/api/users/subscriptions/?cursor=&limit=1')
+        self.assertEqual(response.data['results'][0]['id'], author.pk)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [self.users[1].pk],
+        )
+        self.assertIsNone(response.data['next'])
+
+
+class CounterFieldsTest(RecipeTestCase):
+    """Сохранение устаревшей копии не затирает счетчики."""
+
+    def test_recipe(self):
+        stale = Recipe.objects.get(pk=self.recipes[1].pk)
+        FavoriteRecipe.objects.create(user=self.users[0], recipe=stale)
+        stale.name = 'Новое название'
+        stale.save()
+        recipe = Recipe.objects.get(pk=stale.pk)
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.name, 'Новое название')
+
+    def test_user(self):
+        stale = User.objects.get(pk=self.users[1].pk)
+        Follow.objects.create(user=self.users[0], author=stale)
+        stale.set_password('password-456')
+        stale.save()
+        user = User.objects.get(pk=stale.pk)
+        self.assertEqual(user.followers_count, 1)
+        self.assertTrue(user.check_password('password-456'))
+
+
+class RecipeImageTest(RecipeTestCase):
+    """Копии картинки создаются после коммита и только для новой картинки."""
+
+    def test_renditions_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.users[0], name='С картинкой', text='Описание',
+                cooking_time=5, image=make_image('#30c060'),
+            )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.rendered_image, recipe.image.name)
+        response = self.anonymous.get(f'/api/recipes/{recipe.pk}/')
+        self.assertTrue(response.data['image'].endswith('.1200.png'))
+        self.assertTrue(response.data['image_webp'].endswith('.1200.webp'))
+
+    def test_list_does_not_check_storage(self):
+        with mock.patch.object(FileSystemStorage, 'exists') as exists:
+            response = self.anonymous.get('/api/recipes/')
+        exists.assert_not_called()
+        # Копии еще не созданы: оригинал и без WebP.
+        recipe = response.data[0]
+        self.assertTrue(recipe['image'].endswith('.png'))
+        self.assertNotIn('.480.', recipe['image'])
+        self.assertIsNone(recipe['image_webp'])
+
+    def test_same_image_not_rendered_again(self):
+        recipe = self.recipes[0]
+        Recipe.objects.filter(pk=recipe.pk).update(
+            rendered_image=recipe.image.name
+        )
+        recipe.refresh_from_db()
+        with mock.patch('api.signals.run_in_background') as run:
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.name = 'Новое название'
+                recipe.save()
+        run.assert_not_called()
+
+
+class RecipeSearchTest(RecipeTestCase):
+    """Поиск по названию и описанию, совпадения в названии выше."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.by_name, cls.by_text = cls.recipes[1], cls.recipes[2]
+        cls.by_name.name = 'Борщ со сметаной'
+        cls.by_name.save()
+        cls.by_text.text = 'Подавать к борщу или щам'
+        cls.by_text.save()
+
+    def search(self, query, **params):
+        response = self.anonymous.get(
+            '/api/recipes/', {'search': query, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data]
+
+    def assert_ranked(self):
+        # Более новый рецепт с совпадением в тексте идет вторым.
+        self.assertEqual(
+            self.search('борщ'), [self.by_name.pk, self.by_text.pk]
+        )
+        self.assertEqual(self.search('сметана'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL')
+    def test_postgres(self):
+        self.assert_ranked()
+
+    @skipUnless(connection.vendor == 'sqlite', 'нужен SQLite')
+    def test_sqlite_fts(self):
+        if not fts_available():
+            self.skipTest('SQLite собран без FTS5')
+        self.assert_ranked()
+        self.assertEqual(self.search('БОР'), [self.by_name.pk,
+                                              self.by_text.pk])
+
+    def test_icontains_fallback(self):
+        with mock.patch('api.search.fts_available', return_value=False), \
+                mock.patch.object(connection, 'vendor', 'other'):
+            self.assertEqual(self.search('Борщ'), [self.by_name.pk])
+            self.assertEqual(self.search('щам'), [self.by_text.pk])
+
+    def test_cursor_rejected(self):
+        response = self.anonymous.get(
+            '/api/recipes/', {'search': 'борщ', 'cursor': ''}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('errors', response.data)
+
+
+class CookTest(RecipeTestCase):
+    """Рецепты по имеющимся продуктам и догоняющий индекс процесса."""
+
+    def setUp(self):
+        super().setUp()
+        self.index = RecipeIngredientIndex()
+        patcher = mock.patch('api.views.recipe_index', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cook(self, *ingredients, **params):
+        ids = ','.join(str(ingredient.pk) for ingredient in ingredients)
+        return self.anonymous.get(
+            '/api/recipes/cook/', {'ingredients': ids, **params}
+        )
+
+    def found(self, *ingredients, missing=0):
+        response = self.cook(*ingredients, missing=missing)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data]
+
+    def ids(self, *numbers):
+        return [self.recipes[number].pk for number in numbers]
+
+    def test_missing(self):
+        first = self.ingredients[0]
+        self.assertEqual(self.found(first), self.ids(4, 0))
+        # Сначала рецепты с большей долей имеющихся продуктов.
+        self.assertEqual(self.found(first, missing=1), self.ids(4, 0, 5, 1))
+        self.assertEqual(self.found(first, missing=5), self.ids(
+            4, 0, 5, 1, 2, 3
+        ))
+
+    def test_bad_params(self):
+        first = self.ingredients[0]
+        for params in ({'missing': 6}, {'missing': -1}, {'missing': 'x'}):
+            with self.subTest(**params):
+                response = self.cook(first, **params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('errors', response.data)
+        self.assertEqual(self.cook().status_code, 400)
+
+    def recipe_data(self, *ingredients):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), '#3060c0').save(buffer, 'PNG')
+        image = base64.b64encode(buffer.getvalue()).decode()
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': f'data:image/png;base64,{image}',
+            'tags': [self.tags[0].pk],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_catches_up_by_journal(self):
+        last = self.ingredients[3]
+        self.assertEqual(self.found(last), [])
+        with mock.patch.object(Snapshot, 'build') as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    '/api/recipes/', self.recipe_data(last), format='json'
+                )
+            self.assertEqual(response.status_code, 201)
+            recipe_id = response.data['id']
+            self.assertEqual(self.found(last), [recipe_id])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    f'/api/recipes/{recipe_id}/',
+                    self.recipe_data(self.ingredients[2]), format='json'
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.found(last), [])
+            self.assertIn(recipe_id, self.found(self.ingredients[2]))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(f'/api/recipes/{recipe_id}/')
+            self.assertEqual(response.status_code, 204)
+            self.assertNotIn(recipe_id, self.found(self.ingredients[2]))
+        build.assert_not_called()
+
+    def test_rebuilds_when_journal_expired(self):
+        last = self.ingredients[3]
+        self.assertEqual(self.found(last, missing=3), self.ids(3))
+        with self.captureOnCommitCallbacks(execute=True):
+            NumberIngredient.objects.filter(
+                recipe=self.recipes[3], ingredient=last
+            ).delete()
+        cache.delete(CHANGE_KEY.format(number=cache.get(VERSION_KEY)))
+        with mock.patch.object(
+            Snapshot, 'build', wraps=Snapshot.build
+        ) as build:
+            self.assertEqual(self.found(last, missing=3), [])
+        build.assert_called_once()
+
+
+@override_settings(METRICS_SERVER_TIMING=True)
+class MetricsTest(RecipeTestCase):
+    """Server-Timing считает запросы и рендеринг в обоих режимах."""
+
+    def assert_timing(self, response):
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertIn('db;desc="3 queries"', timing)
+        self.assertIn('render;dur=', timing)
+
+    def test_sync(self):
+        self.assert_timing(APIClient().get('/api/recipes/?limit=2'))
+
+    async def test_async(self):
+        # AsyncClient, в отличие от ASGIHandler, шлет request_started
+        # не в потоке синхронных представлений.
+        await sync_to_async(install_query_wrappers)()
+        self.assert_timing(await AsyncClient().get('/api/recipes/?limit=2'))
+
+
+@override_settings(TIMELINE_SIZE=3)
+class TimelineTest(RecipeTestCase):
+    """Отписка убирает из ленты только рецепты автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            password='password-123', first_name='Повар', last_name='2',
+        )
+        cls.new_recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Новый рецепт {number}',
+                text='Описание', cooking_time=10, image=make_image(),
+            )
+            for number in range(2)
+        ]
+
+    def timeline(self):
+        return list(TimelineEntry.objects.filter(
+            user=self.users[0]
+        ).order_by('-pub_date', '-id').values_list('recipe_id', flat=True))
+
+    def follow(self, author):
+        Follow.objects.create(user=self.users[0], author=author)
+
+    def unfollow(self, author):
+        Follow.objects.get(user=self.users[0], author=author).delete()
+
+    def test_top_up_when_full(self):
+        self.follow(self.users[1])
+        self.follow(self.author)
+        newest = [recipe.pk for recipe in reversed(self.new_recipes)]
+        self.assertEqual(self.timeline(), [*newest, self.recipes[5].pk])
+        self.unfollow(self.author)
+        self.assertEqual(
+            self.timeline(), [recipe.pk for recipe in self.recipes[5::-2]]
+        )
+
+    def test_keeps_other_entries(self):
+        self.follow(self.author)
+        kept = set(TimelineEntry.objects.values_list('pk', flat=True))
+        self.follow(self.users[1])
+        self.unfollow(self.users[1])
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list('pk', flat=True)), kept
+        )
+
+
+@override_settings(RECIPES_CACHE_TIMEOUT=300)
+class PublicCacheTest(RecipeTestCase):
+    """Кэш страниц рецептов для анонимных пользователей."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/recipes/{self.recipes[0].pk}/'
+
+    def version(self):
+        return cache.get(public_cache.VERSION_KEY)
+
+    def write(self, func, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            func(*args, **kwargs)
+
+    def test_hit(self):
+        first = self.anonymous.get('/api/recipes/?tags=lunch&limit=2')
+        with mock.patch.object(RecipeViewSet, 'get_queryset') as queryset:
+            response = self.anonymous.get('/api/recipes/?limit=2&tags=lunch')
+        queryset.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, first.content)
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+
+    def test_skipped_with_authorization(self):
+        self.assertFalse(self.anonymous.get(self.url).json()['is_favorited'])
+        client = APIClient()
+        token = Token.objects.create(user=self.users[0]).key
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        response = client.get(self.url)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertNotIn('public', response.get('Cache-Control', ''))
+        self.assertFalse(self.anonymous.get(self.url).json()['is_favorited'])
+
+    def test_writes_invalidate(self):
+        recipe, tag = self.recipes[0], self.tags[0]
+        ingredient, author = self.ingredients[0], self.users[0]
+        for name, func in (
+            ('recipe', lambda: Recipe.objects.get(pk=recipe.pk).save()),
+            ('recipe tags', lambda: recipe.tags.set(self.tags[1:])),
+            ('tag', lambda: tag.save()),
+            ('ingredient', lambda: ingredient.save()),
+            ('amount', lambda: NumberIngredient.objects.filter(
+                recipe=recipe
+            ).first().save()),
+        ):
+            with self.subTest(name=name):
+                self.anonymous.get(self.url)
+                version = self.version()
+                self.write(func)
+                self.assertNotEqual(self.version(), version)
+        self.anonymous.get(self.url)
+        author.first_name = 'Шеф'
+        self.write(author.save)
+        self.assertEqual(
+            self.anonymous.get(self.url).json()['author']['first_name'],
+            'Шеф',
+        )
+
+    def test_author_fields_not_rendered(self):
+        author = self.users[0]
+        self.anonymous.get(self.url)
+        version = self.version()
+        author.last_login = timezone.now()
+        self.write(author.save, update_fields=('last_login',))
+        author.set_password('new-password-123')
+        self.write(author.save)
+        self.write(User.objects.get(pk=author.pk).save)
+        self.assertEqual(self.version(), version)
+
+
+class LinkTest(RecipeTestCase):
+    """Одиночные связи обновляют то же, что и сигналы ORM."""
+
+    def request(self, method, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url)
+
+    def test_favorite(self):
+        recipe = self.recipes[1]
+        url = f'/api/recipes/{recipe.pk}/'
+        self.assertFalse(self.client.get(url).data['is_favorited'])
+        response = self.request('post', f'{url}favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['id'], recipe.pk)
+        self.assertTrue(self.client.get(url).data['is_favorited'])
+        recipe.refresh_from_db(fields=('favorites_count',))
+        self.assertEqual(recipe.favorites_count, 1)
+        response = self.request('delete', f'{url}favorite/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(self.client.get(url).data['is_favorited'])
+        self.assertEqual(
+            self.request('post', '/api/recipes/999/favorite/').status_code,
+            404,
+        )
+
+    def test_subscribe(self):
+        user, author = self.users
+        url = f'/api/users/{author.pk}/subscribe/'
+        response = self.request('post', url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['id'], author.pk)
+        timeline = TimelineEntry.objects.filter(user=user)
+        self.assertEqual(timeline.count(), 3)
+        author.refresh_from_db(fields=('followers_count',))
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(self.request('post', url).status_code, 400)
+        self.assertEqual(self.request('delete', url).status_code, 204)
+        self.assertFalse(timeline.exists())
+        self.assertEqual(self.request('delete', url).status_code, 404)
+
+
+class BulkTest(RecipeTestCase):
+    """Массовые запросы делают то же, что сигналы одиночных."""
+
+    def bulk(self, url, method, ids):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(
+                url, {'ids': ids}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        return {item['id']: item['status'] for item in response.data}
+
+    def version(self, key):
+        return cache.get(key.format(user_id=self.users[0].pk))
+
+    def favorites_count(self, recipe):
+        recipe.refresh_from_db(fields=('favorites_count',))
+        return recipe.favorites_count
+
+    def test_favorite(self):
+        url = '/api/recipes/favorite/bulk/'
+        first, second = self.recipes[:2]
+        ids = [second.pk, first.pk, 999]
+        version = self.version(relations.VERSION_KEY)
+        self.assertEqual(self.bulk(url, 'post', ids), {
+            second.pk: 'added', first.pk: 'exists', 999: 'not_found',
+        })
+        self.assertNotEqual(self.version(relations.VERSION_KEY), version)
+        self.assertEqual(self.favorites_count(second), 1)
+        self.assertEqual(self.bulk(url, 'post', ids), {
+            second.pk: 'exists', first.pk: 'exists', 999: 'not_found',
+        })
+        self.assertEqual(FavoriteRecipe.objects.filter(
+            user=self.users[0], recipe=second
+        ).count(), 1)
+        self.assertEqual(self.favorites_count(second), 1)
+        self.assertEqual(self.favorites_count(first), 1)
+        ids = [second.pk, self.recipes[2].pk, 999]
+        self.assertEqual(self.bulk(url, 'delete', ids), {
+            second.pk: 'removed', self.recipes[2].pk: 'absent',
+            999: 'not_found',
+        })
+        self.assertEqual(self.favorites_count(second), 0)
+
+    def test_shopping_cart(self):
+        url = '/api/recipes/shopping_cart/bulk/'
+        recipe = self.recipes[0]
+        version = self.version(shopping_cart.VERSION_KEY)
+        self.assertEqual(self.bulk(url, 'post', [recipe.pk]), {
+            recipe.pk: 'added',
+        })
+        added = self.version(shopping_cart.VERSION_KEY)
+        self.assertNotEqual(added, version)
+        recipe.refresh_from_db(fields=('shopping_cart_count',))
+        self.assertEqual(recipe.shopping_cart_count, 1)
+        self.assertEqual(self.bulk(url, 'delete', [recipe.pk]), {
+            recipe.pk: 'removed',
+        })
+        self.assertNotEqual(self.version(shopping_cart.VERSION_KEY), added)
+        self.assertFalse(ShoppingList.objects.exists())
+
+    def test_subscribe(self):
+        url = '/api/users/subscribe/bulk/'
+        user, author = self.users
+        ids = [author.pk, user.pk, 999]
+        self.assertEqual(self.bulk(url, 'post', ids), {
+            author.pk: 'added', user.pk: 'forbidden', 999: 'not_found',
+        })
+        self.assertEqual(self.bulk(url, 'post', ids), {
+            author.pk: 'exists', user.pk: 'forbidden', 999: 'not_found',
+        })
+        author.refresh_from_db(fields=('followers_count',))
+        self.assertEqual(author.followers_count, 1)
+        timeline = TimelineEntry.objects.filter(user=user)
+        self.assertEqual(
+            set(timeline.values_list('recipe_id', flat=True)),
+            {recipe.pk for recipe in self.recipes[1::2]},
+        )
+        self.assertEqual(self.bulk(url, 'delete', [author.pk]), {
+            author.pk: 'removed',
+        })
+        author.refresh_from_db(fields=('followers_count',))
+        self.assertEqual(author.followers_count, 0)
+        self.assertFalse(timeline.exists())
+
+    def test_invalid_ids(self):
+        for data in ({}, {'ids': []}, {'ids': [0]}, {'ids': ['x']}):
+            with self.subTest(data=data):
+                response = self.client.post(
+                    '/api/recipes/favorite/bulk/', data, format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class AsyncViewsTest(RecipeTransactionTestCase):
+    """Асинхронные представления отвечают так же, как синхронные."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Рабочие потоки открывают свои соединения с базой.
+            self.skipTest('нужна база в файле: задайте DB_TEST_NAME')
+        super().setUp()
+        Follow.objects.create(user=self.users[0], author=self.users[1])
+        token = Token.objects.create(user=self.users[0]).key
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.async_client = AsyncClient()
+        self.headers = {'authorization': f'Token {token}'}
+
+    async def compare(self, url, authenticated=True):
+        client = self.client if authenticated else self.anonymous
+        expected = await sync_to_async(client.get)(url)
+        headers = self.headers if authenticated else {}
+        # dispatch вызывает только синхронное представление.
+        with self.settings(ROOT_URLCONF=__name__), mock.patch.object(
+            APIView, 'dispatch', side_effect=AssertionError(url)
+        ):
+            response = await self.async_client.get(url, **headers)
+        self.assertEqual(response.status_code, expected.status_code, url)
+        self.assertEqual(response.json(), expected.json(), url)
+        for header in ('WWW-Authenticate', 'Allow', 'ETag'):
+            self.assertEqual(
+                response.get(header), expected.get(header), (url, header)
+            )
+        return response
+
+    async def test_recipes(self):
+        recipe_id = self.recipes[0].pk
+        for url in (
+            '/api/recipes/', '/api/recipes/?limit=2&page=2',
+            '/api/recipes/?limit=2&tags=lunch', '/api/recipes/?cursor=',
+            '/api/recipes/?fields=name,image&is_favorited=1',
+            f'/api/recipes/{recipe_id}/',
+            f'/api/recipes/{recipe_id}/?omit=ingredients',
+            '/api/recipes/?limit=2&page=99', '/api/recipes/999/',
+            '/api/recipes/?fields=unknown', '/api/recipes/?cursor=bad',
+        ):
+            for authenticated in (True, False):
+                with self.subTest(url=url, authenticated=authenticated):
+                    await self.compare(url, authenticated)
+
+    async def test_catalogs_and_subscriptions(self):
+        for url in (
+            '/api/tags/', '/api/ingredients/', '/api/ingredients/?name=инг',
+            '/api/users/subscriptions/?limit=1&recipes_limit=1',
+        ):
+            with self.subTest(url=url):
+                await self.compare(url)
+        response = await self.compare(
+            '/api/users/subscriptions/', authenticated=False
+        )
+        self.assertEqual(response.status_code, 401)
+
+    async def test_shared_public_cache(self):
+        url = f'/api/recipes/{self.recipes[1].pk}/'
+        with self.settings(RECIPES_CACHE_TIMEOUT=300):
+            await self.compare(url, authenticated=False)
+            with self.settings(ROOT_URLCONF=__name__):
+                with mock.patch.object(RecipeViewSet, 'get_object') as get:
+                    response = await self.async_client.get(url)
+        get.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+
+    async def test_write_falls_back(self):
+        recipe_id = self.recipes[0].pk
+        with self.settings(ROOT_URLCONF=__name__):
+            response = await self.async_client.delete(
+                f'/api/recipes/{recipe_id}/', **self.headers
+            )
+        self.assertEqual(response.status_code, 204)
+        exists = await sync_to_async(
+            Recipe.objects.filter(pk=recipe_id).exists
+        )()
+        self.assertFalse(exists)
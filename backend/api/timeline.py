@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from .models import Follow, Recipe, TimelineEntry
+from .paginators import KeysetPagination
+
+BATCH_SIZE = 1000
+
+
+def prune(user_ids):
+    """Оставляет в лентах пользователей не больше TIMELINE_SIZE записей."""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        # Django 3.2 не умеет фильтровать по оконной функции,
+        # поэтому номер записи проверяем во внешнем запросе.
+        sql, params = TimelineEntry.objects.filter(
+            user_id__in=user_ids[start:start + BATCH_SIZE]
+        ).annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('user')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).values('id', 'row_number').query.sql_with_params()
+        TimelineEntry.objects.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            'WHERE ranked.row_number > %s',
+            (*params, settings.TIMELINE_SIZE),
+        )).delete()
+
+
+def fan_out(recipe):
+    """Кладет новый рецепт в ленты всех подписчиков автора."""
+    followers = list(Follow.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True))
+    TimelineEntry.objects.bulk_create((
+        TimelineEntry(
+            user_id=user_id,
+            recipe_id=recipe.pk,
+            author_id=recipe.author_id,
+            pub_date=recipe.pub_date,
+        )
+        for user_id in followers
+    ), batch_size=BATCH_SIZE, ignore_conflicts=True)
+    prune(followers)
+
+
+def backfill(user_id, author_ids):
+    """Добавляет в ленту последние рецепты авторов после подписки."""
+    recipes = Recipe.objects.filter(author_id__in=author_ids).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'author_id', 'pub_date')[:settings.TIMELINE_SIZE]
+    TimelineEntry.objects.bulk_create((
+        TimelineEntry(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for recipe_id, author_id, pub_date in recipes
+    ), batch_size=BATCH_SIZE, ignore_conflicts=True)
+    prune([user_id])
+
+
+def drop_authors(user_id, author_ids):
+    """Убирает из ленты рецепты авторов после отписки.
+
+    Если лента была заполнена до лимита, записи оставшихся подписок
+    могли быть вытеснены: освободившиеся места занимают их рецепты,
+    которые старше последней записи ленты.
+    """
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    full = entries.count() >= settings.TIMELINE_SIZE
+    removed, _ = entries.filter(author_id__in=author_ids).delete()
+    if not full or not removed:
+        return
+    recipes = Recipe.objects.filter(author__following__user_id=user_id)
+    oldest = entries.order_by('pub_date', 'id').values_list(
+        'pub_date', 'recipe_id'
+    ).first()
+    if oldest is not None:
+        recipes = recipes.filter(
+            KeysetPagination.after(('-pub_date', '-id'), oldest)
+        )
+    TimelineEntry.objects.bulk_create((
+        TimelineEntry(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for recipe_id, author_id, pub_date in recipes.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', 'author_id', 'pub_date')[:removed]
+    ), batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def rebuild_timeline(user_id):
+    """Заполняет ленту пользователя заново."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    recipes = Recipe.objects.filter(
+        author__following__user_id=user_id
+    ).order_by('-pub_date', '-id').values_list(
+        'id', 'author_id', 'pub_date'
+    )[:settings.TIMELINE_SIZE]
+    TimelineEntry.objects.bulk_create((
+        TimelineEntry(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for recipe_id, author_id, pub_date in recipes
+    ), batch_size=BATCH_SIZE)
+
+
+def rebuild_timelines():
+    """Заполняет все ленты заново по текущим подпискам."""
+    TimelineEntry.objects.all().delete()
+    for user_id in Follow.objects.values_list(
+        'user_id', flat=True
+    ).distinct().order_by():
+        rebuild_timeline(user_id)
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .metrics import metrics_view
 from .views import IngredientsViewSet, RecipeViewSet, TagViewSet, UserViewSet
 
 router = DefaultRouter()
@@ -10,5 +12,11 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('tags', TagViewSet, basename='tags')
 
 urlpatterns = [
+    path('metrics/', metrics_view, name='metrics'),
     path('', include(router.urls)),
 ]
+
+if settings.ASGI_MODE:
+    from . import async_views
+
+    urlpatterns = async_views.urlpatterns + urlpatterns
@@ -1,31 +1,174 @@
+from collections import defaultdict
+from functools import partial
+
 from django.contrib.auth import get_user_model
-from django.http.response import HttpResponse
+from django.db import transaction
+from django.db.models import BooleanField, F, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
+from django.http import Http404
+from django.http.response import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
 from djoser.views import UserViewSet
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from .filters import IngredientNameFilter, RecipeFilter
+from .autocomplete import ingredient_index
+from .bulk import bulk_add, bulk_remove
+from .catalogs import catalog_response, get_catalog
+from .cookbook import recipe_index
+from .filters import RecipeFilter
+from .links import add_link, remove_link, target_pk
 from .models import (FavoriteRecipe, Follow, Ingredient, NumberIngredient,
-                     Recipe, ShoppingList, Tag)
-from .paginators import CustomPagination
+                     Recipe, ShoppingList, Tag, TimelineEntry)
+from .paginators import CustomPagination, KeysetPagination
 from .permissions import IsOwnerOrAdminOrReadOnly
-from .serializers import (FollowSerializer, IngredientSerializer,
-                          RecipeSerializer, TagSerializer, SummuryRecipeSerializer,
+from .public_cache import cache_public_response
+from .serializers import (BulkIdsSerializer, FollowSerializer,
+                          IngredientSerializer, RecipeSerializer,
+                          TagSerializer, SummuryRecipeSerializer,
                           UserSerializer)
+from .shopping_cart import (EXPORT_FORMATS, JOB_DONE, get_cached_export,
+                            get_cart_version, get_etag, get_export,
+                            get_export_job, start_export_job)
 
 User = get_user_model()
 
+MAX_MISSING = 5
+
+RECIPE_FIELDS = RecipeSerializer.Meta.fields
+# Карточка рецепта в списке: без описания и состава.
+RECIPE_CARD_FIELDS = tuple(
+    field for field in RECIPE_FIELDS if field not in ('text', 'ingredients')
+)
+# Колонки рецепта, которые читает каждое поле сериализатора.
+RECIPE_COLUMNS = {
+    'name': ('name',),
+    'image': ('image', 'rendered_image'),
+    'image_webp': ('image', 'rendered_image'),
+    'text': ('text',),
+    'cooking_time': ('cooking_time',),
+    'author': ('author__email', 'author__username',
+               'author__first_name', 'author__last_name'),
+}
+
+
+def attach_recipes(follows, limit):
+    """Рецепты авторов страницы одним запросом, не больше limit на автора."""
+    recipes = Recipe.objects.filter(
+        author__in=[follow.author_id for follow in follows]
+    )
+    if limit and limit.isdigit():
+        # Django 3.2 не умеет фильтровать по оконной функции,
+        # поэтому ограничение накладываем во внешнем запросе.
+        sql, params = recipes.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked '
+            'WHERE ranked.row_number <= %s '
+            'ORDER BY ranked.row_number',
+            (*params, int(limit)),
+        )
+    by_author = defaultdict(list)
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    for follow in follows:
+        follow.recipes_preview = by_author[follow.author_id]
+
+
+def bulk_response(model, request):
+    """Массовое добавление (POST) или удаление (DELETE) связей по ids."""
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    apply = bulk_add if request.method == 'POST' else bulk_remove
+    result = apply(model, request.user, serializer.validated_data['ids'])
+    return Response([
+        {'id': pk, 'status': value} for pk, value in result.items()
+    ])
+
+
+def split_param(request, name):
+    value = request.GET.get(name, '')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def recipe_fields(request, default=RECIPE_FIELDS):
+    """Поля рецепта по параметрам fields= и omit=, id выводится всегда."""
+    fields = split_param(request, 'fields') or default
+    omit = split_param(request, 'omit')
+    unknown = set(fields).union(omit) - set(RECIPE_FIELDS)
+    if unknown:
+        raise ValidationError({'fields': [
+            f'Неизвестные поля: {", ".join(sorted(unknown))}.'
+        ]})
+    return tuple(
+        field for field in RECIPE_FIELDS
+        if field == 'id' or (field in fields and field not in omit)
+    )
+
+
+def recipe_queryset(fields=RECIPE_FIELDS):
+    """Рецепты с подгруженными связями.
+
+    Выбираются только колонки и связи, нужные полям fields.
+    Флаги пользователя сериализатор берет из get_user_relations.
+    """
+    queryset = Recipe.objects.all()
+    if fields == RECIPE_FIELDS:
+        # Полный рецепт нужен и для записи, колонки не ограничиваем.
+        queryset = queryset.select_related('author')
+    else:
+        columns = ['pub_date']
+        if 'author' in fields:
+            queryset = queryset.select_related('author')
+        else:
+            # Упомянутая в only() связь загрузила бы автора целиком.
+            columns.append('author')
+        queryset = queryset.only(*columns, *(
+            column for field in fields
+            for column in RECIPE_COLUMNS.get(field, ())
+        ))
+    if 'tags' in fields:
+        queryset = queryset.prefetch_related('tags')
+    if 'ingredients' in fields:
+        queryset = queryset.prefetch_related(Prefetch(
+            'numberingredient_set',
+            queryset=NumberIngredient.objects.select_related('ingredient')
+        ))
+    return queryset
+
+
+def subscriptions_queryset(user):
+    """Подписки пользователя: все строки — его подписки, запрос не нужен."""
+    return Follow.objects.filter(user=user).select_related(
+        'author'
+    ).annotate(
+        is_subscribed=Value(True, output_field=BooleanField())
+    ).order_by('-id')
 
-class UserViewSet(UserViewSet):
+
+class CursorPaginationMixin:
+    """Включает курсорную пагинацию, если в запросе передан cursor."""
+
+    @property
+    def paginator(self):
+        if (not hasattr(self, '_paginator')
+                and 'cursor' in self.request.query_params):
+            self._paginator = KeysetPagination()
+        return super().paginator
+
+
+class UserViewSet(CursorPaginationMixin, UserViewSet):
     queryset = User.objects.all()
     pagination_class = CustomPagination
+    cursor_ordering = ('-id',)
     serializer_class = UserSerializer
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
 
@@ -34,67 +177,97 @@ class UserViewSet(UserViewSet):
         methods=('post',),
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        if user == author:
+        author_id = target_pk(Follow, id)
+        if author_id == user.id:
             return Response({
                 'errors': 'Подписка на себя запрещена.'
             }, status=status.HTTP_400_BAD_REQUEST)
-        if Follow.objects.filter(user=user, author=author).exists():
+        if not add_link(Follow, user, author_id):
+            get_object_or_404(User, id=author_id)
             return Response({
                 'errors': 'Вы уже подписаны на данного пользователя.'
             }, status=status.HTTP_400_BAD_REQUEST)
-        follow = Follow.objects.create(user=user, author=author)
         serializer = FollowSerializer(
-            follow, context={'request': request}
+            Follow(user=user, author_id=author_id),
+            context={'request': request},
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
+    @transaction.atomic
     def delete_subscribe(self, request, id=None):
-        user = request.user
-        author = get_object_or_404(User, id=id)
-        subscribe = get_object_or_404(
-            Follow, user=user, author=author
-        )
-        subscribe.delete()
+        if not remove_link(Follow, request.user, id):
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        url_path='subscribe/bulk',
+        permission_classes=[IsAuthenticated]
+    )
+    def subscribe_bulk(self, request):
+        return bulk_response(Follow, request)
+
     @action(
         detail=False,
         permission_classes=[IsAuthenticated]
     )
     def subscriptions(self, request):
-        user = request.user
-        queryset = Follow.objects.filter(user=user)
-        pages = self.paginate_queryset(queryset)
+        queryset = subscriptions_queryset(request.user)
+        page = self.paginate_queryset(queryset)
+        follows = list(queryset) if page is None else page
+        attach_recipes(follows, request.query_params.get('recipes_limit'))
         serializer = FollowSerializer(
-            pages,
+            follows,
             many=True,
             context={'request': request}
         )
+        if page is None:
+            return Response(serializer.data)
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class CatalogListMixin:
+    """Отдает список справочника из кэша с поддержкой условных запросов."""
+
+    catalog_name = None
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        catalog = get_catalog(self.catalog_name, lambda: self.get_serializer(
+            self.get_queryset(), many=True
+        ).data)
+        return catalog_response(request, catalog)
+
+
+class TagViewSet(CatalogListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
     pagination_class = None
+    catalog_name = 'tags'
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+class IngredientsViewSet(CatalogListMixin, viewsets.ModelViewSet):
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
-    filter_backends = [IngredientNameFilter]
     pagination_class = None
-    search_fields = ('^name',)
-    
+    catalog_name = 'ingredients'
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     pagination_class = CustomPagination
@@ -102,8 +275,46 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = RecipeFilter
     permission_classes = [IsOwnerOrAdminOrReadOnly]
 
+    def get_queryset(self):
+        return recipe_queryset(self.get_recipe_fields())
+
+    def get_recipe_fields(self):
+        if self.action == 'list':
+            return recipe_fields(self.request, RECIPE_CARD_FIELDS)
+        if self.action == 'retrieve':
+            return recipe_fields(self.request)
+        return RECIPE_FIELDS
+
+    def list(self, request, *args, **kwargs):
+        return cache_public_response(
+            request, partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return cache_public_response(
+            request, partial(super().retrieve, request, *args, **kwargs)
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'retrieve':
+            context['image_rendition'] = 'full'
+        context['fields'] = self.get_recipe_fields()
+        return context
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        self.refresh_instance(serializer)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self.refresh_instance(serializer)
+
+    def refresh_instance(self, serializer):
+        """Перечитывает рецепт с подгруженными связями для ответа."""
+        serializer.instance = self.get_queryset().get(
+            pk=serializer.instance.pk
+        )
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
@@ -123,55 +334,162 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.delete_obj(ShoppingList, request.user, pk)
         return None
 
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite/bulk',
+            permission_classes=[IsAuthenticated])
+    def favorite_bulk(self, request):
+        return bulk_response(FavoriteRecipe, request)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart/bulk',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_bulk(self, request):
+        return bulk_response(ShoppingList, request)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь."""
+        paginator = KeysetPagination()
+        entries = paginator.paginate_queryset(
+            TimelineEntry.objects.filter(user=request.user).only(
+                'id', 'recipe_id', 'pub_date'
+            ), request, view=self
+        )
+        recipes = self.get_queryset().in_bulk(
+            [entry.recipe_id for entry in entries]
+        )
+        serializer = self.get_serializer([
+            recipes[entry.recipe_id] for entry in entries
+            if entry.recipe_id in recipes
+        ], many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def cook(self, request):
+        """Рецепты, для которых хватает продуктов из ingredients.
+
+        missing — сколько продуктов рецепта может не хватать.
+        """
+        try:
+            ingredient_ids = [
+                int(value)
+                for item in request.query_params.getlist('ingredients')
+                for value in item.split(',') if value
+            ]
+            missing = int(request.query_params.get('missing', 0))
+        except ValueError:
+            ingredient_ids, missing = None, -1
+        if not ingredient_ids or not 0 <= missing <= MAX_MISSING:
+            return Response({
+                'errors': ('Передайте id продуктов в ingredients и число '
+                           f'от 0 до {MAX_MISSING} в missing.')
+            }, status=status.HTTP_400_BAD_REQUEST)
+        recipe_ids = recipe_index.search(ingredient_ids, missing)
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(recipe_ids, request, view=self)
+        if page is not None:
+            recipe_ids = page
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        serializer = self.get_serializer([
+            recipes[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ], many=True)
+        if page is None:
+            return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
-        final_list = {}
-        ingredients = NumberIngredient.objects.filter(
-            recipe__shoppinglist__user=request.user).values_list(
-            'ingredient__name', 'ingredient__measure',
-            'amount')
-        for item in ingredients:
-            name = item[0]
-            if name not in final_list:
-                final_list[name] = {
-                    'measure': item[1],
-                    'amount': item[2]
-                }
-            else:
-                final_list[name]['amount'] += item[2]
-        pdfmetrics.registerFont(
-            TTFont('Slimamif', 'Slimamif.ttf', 'UTF-8'))
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = ('attachment; '
-                                           'filename="shopping_list.pdf"')
-        page = canvas.Canvas(response)
-        page.setFont('Slimamif', size=24)
-        page.drawString(200, 800, 'Список ингредиентов')
-        page.setFont('Slimamif', size=16)
-        height = 750
-        for i, (name, data) in enumerate(final_list.items(), 1):
-            page.drawString(75, height, (f'<{i}> {name} - {data["amount"]}, '
-                                         f'{data["measure"]}'))
-            height -= 25
-        page.showPage()
-        page.save()
+        file_type = request.query_params.get('type', 'pdf')
+        if file_type not in EXPORT_FORMATS:
+            return self.wrong_export_type()
+        version = get_cart_version(request.user.id)
+        etag = get_etag(request.user.id, version, file_type)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        content = get_export(request.user, version, file_type)
+        return self.export_response(content, file_type, etag)
+
+    @action(detail=False, methods=['post'],
+            url_path='download_shopping_cart/jobs',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_jobs(self, request):
+        file_type = request.data.get(
+            'type', request.query_params.get('type', 'pdf')
+        )
+        if file_type not in EXPORT_FORMATS:
+            return self.wrong_export_type()
+        job = start_export_job(request.user, file_type)
+        return Response(self.job_data(job), status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'],
+            url_path=r'download_shopping_cart/jobs/(?P<job_id>[0-9a-f]{32})',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_job(self, request, job_id=None):
+        job = self.get_job(request, job_id)
+        return Response(self.job_data(job))
+
+    @action(detail=False, methods=['get'],
+            url_path=(r'download_shopping_cart/jobs/'
+                      r'(?P<job_id>[0-9a-f]{32})/download'),
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_job_download(self, request, job_id=None):
+        job = self.get_job(request, job_id)
+        if job['status'] != JOB_DONE:
+            return Response(
+                self.job_data(job), status=status.HTTP_409_CONFLICT
+            )
+        content = get_cached_export(
+            request.user.id, job['version'], job['type']
+        )
+        if content is None:
+            raise Http404
+        return self.export_response(content, job['type'], get_etag(
+            request.user.id, job['version'], job['type']
+        ))
+
+    def get_job(self, request, job_id):
+        job = get_export_job(job_id, request.user)
+        if job is None:
+            raise Http404
+        return job
+
+    def job_data(self, job):
+        return {key: job[key] for key in ('id', 'type', 'status')}
+
+    def wrong_export_type(self):
+        return Response({
+            'errors': ('Допустимые форматы: '
+                       f'{", ".join(EXPORT_FORMATS)}')
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    def export_response(self, content, file_type, etag):
+        content_type, _ = EXPORT_FORMATS[file_type]
+        response = HttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_type}"'
+        )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
         return response
 
+    @transaction.atomic
     def add_obj(self, model, user, pk):
-        if model.objects.filter(user=user, recipe__id=pk).exists():
+        if not add_link(model, user, pk):
+            get_object_or_404(Recipe, id=pk)
             return Response({
                 'errors': 'Рецепт уже добавлен в список'
             }, status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(user=user, recipe=recipe)
-        serializer = SummuryRecipeSerializer(recipe)
+        serializer = SummuryRecipeSerializer(Recipe.objects.get(id=pk))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete_obj(self, model, user, pk):
-        obj = model.objects.filter(user=user, recipe__id=pk)
-        if obj.exists():
-            obj.delete()
+        if remove_link(model, user, pk):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({
             'errors': 'Рецепт уже удален'
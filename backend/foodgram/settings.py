@@ -26,6 +26,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +58,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Под ASGI горячие эндпоинты чтения обслуживают асинхронные представления.
+ASGI_MODE = os.getenv('ASGI_MODE', default='False') == 'True'
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
@@ -64,7 +68,22 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Рабочие потоки асинхронных представлений держат свои соединения.
+        'CONN_MAX_AGE': int(
+            os.getenv('DB_CONN_MAX_AGE', default=60 if ASGI_MODE else 0)
+        ),
+        'TEST': {'NAME': os.getenv('DB_TEST_NAME')},
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
     }
 }
 
@@ -115,12 +134,17 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
+
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.metrics.MetricsJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 DJOSER = {
@@ -134,3 +158,41 @@ DJOSER = {
         'set_password': 'users.serializers.CustomSetPasswordSerializer',
     },
 }
+
+SHOPPING_CART_EXPORT_TIMEOUT = 60 * 60
+
+SHOPPING_CART_EXPORT_WORKERS = 2
+
+# Через сколько секунд ожидающая выгрузка считается потерянной.
+SHOPPING_CART_EXPORT_STALE = 60
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='False') == 'True'
+
+METRICS_SERVER_TIMING = (
+    os.getenv('METRICS_SERVER_TIMING', default='False') == 'True'
+)
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=10000))
+
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', default=60))
+
+USER_RELATIONS_CACHE_TIMEOUT = int(
+    os.getenv('USER_RELATIONS_CACHE_TIMEOUT', default=300)
+)
+
+TIMELINE_SIZE = 500
+
+RECIPES_CACHE_TIMEOUT = int(os.getenv('RECIPES_CACHE_TIMEOUT', default=300))
+
+RECIPES_CACHE_MAX_AGE = int(os.getenv('RECIPES_CACHE_MAX_AGE', default=0))
+
+RECIPE_IMAGE_RENDITIONS = {
+    'thumb': 160,
+    'card': 480,
+    'full': 1200,
+}
+
+# Потоки для уменьшенных копий картинок; 0 - создавать сразу после коммита.
+RECIPE_IMAGE_WORKERS = 2
@@ -9,7 +9,8 @@ class UserAdmin(admin.ModelAdmin):
 
     list_display = ('pk', 'username',
                     'email', 'first_name',
-                    'last_name', 'role')
+                    'last_name', 'role', 'recipes_count',
+                    'followers_count')
     search_fields = ('username',)
     list_filter = ('role',)
     empty_value_display = '-пусто-'
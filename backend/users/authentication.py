@@ -0,0 +1,118 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+VERSION_KEY = 'auth:user:{user_id}:version'
+
+
+def get_auth_version(user_id):
+    return cache.get_or_set(
+        VERSION_KEY.format(user_id=user_id), uuid.uuid4().hex, None
+    )
+
+
+def freeze(instance):
+    """Значения полей объекта модели, из которых его можно собрать заново."""
+    names = [field.attname for field in instance._meta.concrete_fields]
+    return (type(instance), instance._state.db, names,
+            [getattr(instance, name) for name in names])
+
+
+def thaw(frozen):
+    model, db, names, values = frozen
+    return model.from_db(db, names, values)
+
+
+class TokenCache:
+    """Ограниченный LRU-кэш «ключ токена -> пользователь» в памяти процесса.
+
+    Запись живет не дольше TOKEN_CACHE_TTL секунд и сверяется с версией
+    пользователя в кэше Django. Выход, удаление токена, смена пароля и
+    деактивация через save() меняют версию, и с общим кэшем (memcached)
+    токен сразу отзывается во всех процессах. С кэшем в памяти процесса
+    остальные процессы узнают об этом только через TOKEN_CACHE_TTL.
+    Массовые update() сигналов не отправляют: после них нужно вызвать
+    invalidate_user, иначе токен тоже живет до конца TTL.
+
+    Хранятся значения полей, каждый запрос получает свои объекты
+    пользователя и токена.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        user_id, user, token, version, expires = entry
+        if expires < time.monotonic() or version != cache.get(
+            VERSION_KEY.format(user_id=user_id)
+        ):
+            self.discard(key)
+            return None
+        user, token = thaw(user), thaw(token)
+        token.user = user
+        return user, token
+
+    def set(self, key, user, token, version):
+        """Запоминает токен с версией, прочитанной до запроса к базе."""
+        entry = (user.pk, freeze(user), freeze(token), version,
+                 time.monotonic() + settings.TOKEN_CACHE_TTL)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        """Отзывает токены пользователя во всех процессах с общим кэшем."""
+        cache.set(VERSION_KEY.format(user_id=user_id), uuid.uuid4().hex, None)
+        with self._lock:
+            for key in [
+                key for key, entry in self._entries.items()
+                if entry[0] == user_id
+            ]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену без запроса к базе для известных токенов."""
+
+    def authenticate_credentials(self, key):
+        if not settings.TOKEN_CACHE_SIZE:
+            return super().authenticate_credentials(key)
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        # Версия читается до выборки пользователя: если токен отзовут
+        # между ними, запись в кэше сразу окажется устаревшей.
+        user_id = self.get_model().objects.filter(key=key).values_list(
+            'user_id', flat=True
+        ).first()
+        if user_id is None:
+            return super().authenticate_credentials(key)
+        version = get_auth_version(user_id)
+        user, token = super().authenticate_credentials(key)
+        if user.pk == user_id:
+            token_cache.set(key, user, token, version)
+        return user, token
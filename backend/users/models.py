@@ -2,7 +2,32 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class CustomUser(AbstractUser):
+class CounterFieldsMixin:
+    """Счетчики из COUNTER_FIELDS меняются только через F().
+
+    save() существующей строки их не записывает: копия в памяти
+    бывает устаревшей и затерла бы чужие изменения.
+    """
+
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert'):
+            fields = kwargs.get('update_fields')
+            if fields is None:
+                deferred = self.get_deferred_fields()
+                fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.attname not in deferred
+                ]
+            kwargs['update_fields'] = [
+                name for name in fields if name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class CustomUser(CounterFieldsMixin, AbstractUser):
     """Кастомная модель User."""
 
     USER = 'user'
@@ -24,9 +49,16 @@ class CustomUser(AbstractUser):
         to='self',
         symmetrical=False,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
+    COUNTER_FIELDS = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model, user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+User = get_user_model()
+
+
+def revoke(user_id):
+    """Отзывает токены сразу и еще раз после коммита.
+
+    Повторный сброс не дает закэшировать токен, прочитанный из базы
+    до завершения транзакции.
+    """
+    token_cache.invalidate_user(user_id)
+    transaction.on_commit(lambda: token_cache.invalidate_user(user_id))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    revoke(instance.user_id)
+
+
+@receiver((post_save, post_delete), sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Смена пароля, деактивация и удаление пользователя."""
+    revoke(instance.pk)
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, user, **kwargs):
+    if user is not None and user.pk is not None:
+        revoke(user.pk)
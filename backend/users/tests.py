@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from .authentication import CachedTokenAuthentication, token_cache
+
+User = get_user_model()
+
+
+@override_settings(TOKEN_CACHE_SIZE=100, TOKEN_CACHE_TTL=60)
+class TokenCacheTest(TestCase):
+    """Закэшированный токен отзывается вместе с токеном в базе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru',
+            password='password-123', first_name='Повар', last_name='0',
+        )
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.auth = CachedTokenAuthentication()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def authenticate(self):
+        return self.auth.authenticate_credentials(self.token.key)
+
+    def assert_revoked(self):
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_cached(self):
+        first, _ = self.authenticate()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertIs(token.user, user)
+        # Каждый запрос получает свой объект пользователя.
+        self.assertIsNot(user, first)
+        self.assertIsNot(user._state, first._state)
+        user.first_name = 'Другой'
+        self.assertEqual(self.authenticate()[0].first_name, 'Повар')
+
+    def test_logout(self):
+        self.authenticate()
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_revoked()
+
+    def test_deactivation(self):
+        self.authenticate()
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        self.assert_revoked()
+
+    def test_token_deleted(self):
+        self.authenticate()
+        Token.objects.filter(user=self.user).delete()
+        self.assert_revoked()
+
+    def test_ttl(self):
+        with mock.patch('users.authentication.time.monotonic') as monotonic:
+            monotonic.return_value = 1000.0
+            self.authenticate()
+            # update() идет мимо сигналов, токен живет до конца TTL.
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+            monotonic.return_value = 1059.0
+            self.assertEqual(self.authenticate()[0].pk, self.user.pk)
+            monotonic.return_value = 1061.0
+            self.assert_revoked()